@@ -0,0 +1,51 @@
+"""
+Batched child-row lookups: one IN (...) query for a whole page of parents,
+grouped in Python, instead of one query per parent row.
+"""
+
+
+def placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def group_children(conn, query, parent_ids, extra_params=(), limit=None):
+    """
+    Run `query`, whose `{ids}` marker expands to the parent ids and whose rows
+    are (parent_id, value), and return {parent_id: [value, ...]} with every
+    parent present. `limit` keeps at most that many values per parent.
+    """
+    grouped = {parent_id: [] for parent_id in parent_ids}
+    if not grouped:
+        return grouped
+
+    ids = list(grouped)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query.format(ids=placeholders(ids)), tuple(ids) + tuple(extra_params))
+        for parent_id, value in cursor.fetchall():
+            children = grouped.get(parent_id)
+            if children is not None and (limit is None or len(children) < limit):
+                children.append(value)
+    finally:
+        cursor.close()
+    return grouped
+
+
+def group_likes_by_restaurant(conn, group_code, restaurant_ids):
+    """Usernames of the members of `group_code` who liked each restaurant"""
+    return group_children(
+        conn,
+        """
+        SELECT ur.restaurant_id, ur.username
+        FROM user_restaurant ur
+        JOIN group_user gu ON ur.username = gu.username
+        WHERE ur.restaurant_id IN ({ids}) AND gu.group_code = %s
+        """,
+        restaurant_ids, extra_params=(group_code,))
+
+
+def preferences_by_user(conn, usernames):
+    return group_children(
+        conn,
+        "SELECT username, preference FROM user_preference WHERE username IN ({ids})",
+        usernames)
@@ -1,4 +1,3 @@
-import mysql.connector
 import os
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify
@@ -10,24 +9,145 @@ import random
 import string
 import sys
 import json
+import numpy as np
 from flask_socketio import SocketIO, join_room, leave_room, emit
+import db_pool
+import batch_queries as bq
+import catalogue as cat
+import result_cache
+import deck_worker
 
 sys.path.insert(0,"src/vectorization/")
 import vectorization as vect
+import vector_index as vindex
+import ann_index as ann
+import tag_embeddings as tags
+import group_ranking
 
 # Load environment variables
 load_dotenv()
 
 def get_db_connection():
-    """Establish connection to SingleStore database"""
-    conn = mysql.connector.connect(
-        host=os.getenv("DB_HOST"),
-        user=os.getenv("DB_USERNAME"),
-        password=os.getenv("DB_PASSWORD"),
-        database=os.getenv("DB_DATABASE"),
-        port=int(os.getenv("DB_PORT"))
-    )
-    return conn
+    """Check out a pooled connection to SingleStore; close() returns it to the pool"""
+    return db_pool.get_pool().connection()
+
+# In-process restaurant vector index, loaded on first use
+restaurant_index = None
+
+def get_restaurant_index(conn = None):
+    """
+    Return the restaurant vector index, loading it from disk or the database if needed.
+    Callers holding a connection pass it as `conn` instead of checking out a second one.
+    """
+    global restaurant_index
+    if restaurant_index is None:
+        # With ANN_INDEX_PATH set, searches go through a persisted IVF index
+        ann_path = ann.ann_index_path()
+        n_probe = int(os.getenv("ANN_N_PROBE", "4"))
+
+        own_conn = conn is None
+        if own_conn:
+            conn = get_db_connection()
+        try:
+            if ann_path and os.path.exists(ann_path):
+                # The file may lag behind the table, e.g. after a populate.py run with another ANN_INDEX_PATH
+                index = ann.load_restaurant_ann(ann_path, n_probe)
+                if ann.sync_restaurant_ann(index, conn):
+                    ann.save_restaurant_ann(index, ann_path)
+                restaurant_index = index
+            elif ann_path:
+                exact = vindex.load_restaurant_index(conn)
+                restaurant_index = ann.build_restaurant_ann(exact.ids, exact.food.matrix, exact.place.matrix,
+                                                            n_lists=int(os.getenv("ANN_N_LISTS", "16")), n_probe=n_probe)
+                ann.save_restaurant_ann(restaurant_index, ann_path)
+            else:
+                restaurant_index = vindex.load_restaurant_index(conn, quantization=os.getenv("VECTOR_QUANTIZATION"))
+        finally:
+            if own_conn:
+                conn.close()
+    return restaurant_index
+
+def add_to_restaurant_index(restaurant_id, food_vector, place_vector, conn = None):
+    """Insert a new restaurant into the vector index, persisting the ANN index if enabled"""
+    index = get_restaurant_index(conn)
+    # An index loaded from the database after the commit already holds the row
+    if restaurant_id in index.ids:
+        return
+    index.add(restaurant_id, food_vector, place_vector)
+    if ann.ann_index_path():
+        ann.save_restaurant_ann(index, ann.ann_index_path())
+
+def catalogue_changed():
+    """Restaurants were written (e.g. by populate.py): reload the vector index and every deck"""
+    global restaurant_index
+    restaurant_index = None
+    decks.rebuild_all(clear=True)
+
+# Restaurant metadata and photo URLs, cached in process
+catalogue = cat.Catalogue(get_db_connection,
+                          ttl=float(os.getenv("CATALOGUE_TTL", "3600")),
+                          check_interval=float(os.getenv("CATALOGUE_CHECK_INTERVAL", "30")),
+                          on_change=catalogue_changed)
+
+# Recommendation decks keyed by (username, user vector version, catalogue version)
+recommendation_cache = result_cache.LRUCache(int(os.getenv("RECOMMENDATION_CACHE_SIZE", "10000")))
+user_vector_versions = result_cache.VersionMap()
+
+# Deck size and default weights of the fused food + place score
+DECK_SIZE = int(os.getenv("DECK_SIZE", "10"))
+FOOD_WEIGHT = float(os.getenv("FOOD_WEIGHT", "1.0"))
+PLACE_WEIGHT = float(os.getenv("PLACE_WEIGHT", "1.0"))
+
+# How member scores are folded into a group ranking: mean, least_misery or borda
+GROUP_AGGREGATION = os.getenv("GROUP_AGGREGATION", "mean")
+
+# Precomputed recommendation decks, refreshed in the background
+decks = deck_worker.DeckWorker(get_db_connection, get_restaurant_index, user_vector_versions,
+                               deck_size=DECK_SIZE, food_weight=FOOD_WEIGHT, place_weight=PLACE_WEIGHT,
+                               rebuild_hour=int(os.getenv("DECK_REBUILD_HOUR", "3")))
+
+def score_weights():
+    """Per-request food / place weights from the query string, defaulting to FOOD_WEIGHT / PLACE_WEIGHT"""
+    return (request.args.get('food_weight', FOOD_WEIGHT, type=float),
+            request.args.get('place_weight', PLACE_WEIGHT, type=float))
+
+def user_vectors_changed(username):
+    """Invalidate a user's cached results and schedule their deck for recomputation"""
+    user_vector_versions.bump(username)
+    decks.mark_dirty(username)
+
+def deck_entry(restaurant):
+    """Format a catalogue record as a card of the swipe deck"""
+    if restaurant['price_range_min'] == 0:
+        price_range = ""
+    else:
+        price_range = "(" + str(restaurant['price_range_min']) + "€-" + str(restaurant['price_range_max']) + "€)"
+    return {
+        'restaurant_name': restaurant['name'],
+        'rating': restaurant['rating'],
+        'url': restaurant['url_location'],
+        'price_level': restaurant['price_level'],
+        'summary': restaurant['summary'],
+        'images': restaurant['photos'][:1],
+        'price_range': price_range
+    }
+
+# Precomputed preference tag vectors, loaded on first use
+tag_table = None
+
+def get_tag_table():
+    """Return the preference tag table, or None if it has not been built"""
+    global tag_table
+    if tag_table is None:
+        tag_table = tags.load_tag_table(os.getenv("TAG_TABLE_PATH", tags.DEFAULT_TABLE_PATH))
+    return tag_table
+
+def preference_embedding(preferences, food = 0):
+    """Compose a preference vector from the tag table, falling back to the LLM + embedding path"""
+    vector = tags.compose_preference_vector(get_tag_table(), preferences, food)
+    if vector is None:
+        vector = vect.create_embeddings_from_preferences(preferences, food)
+    return vect.vector_to_list(vector)
 
 #drop all tables
 def drop_all_tables():
@@ -94,7 +214,8 @@ def init_db():
             type VARCHAR(100) NOT NULL,
             reservable BOOLEAN NOT NULL,
             vegetarian BOOLEAN NOT NULL,
-            summary VARCHAR(500) NOT NULL
+            summary VARCHAR(500) NOT NULL,
+            content_hash CHAR(64)
         )
         ''')
 
@@ -159,6 +280,9 @@ def init_db():
         )
         ''')
 
+        # Version stamp of the restaurant catalogue, bumped on every write
+        cursor.execute(cat.VERSION_TABLE)
+
         # Creat user history
 
         cursor.execute('''
@@ -283,6 +407,15 @@ def generate_group_code():
     """Generate a unique 6-character group code"""
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
+# Connection pool metrics: checkouts, waits and wait times
+@app.route('/metrics/db', methods=['GET'])
+def get_db_metrics():
+    return jsonify(db_pool.get_pool().stats()), 200
+
+@app.route('/metrics/recommendations', methods=['GET'])
+def get_recommendation_metrics():
+    return jsonify({'cache': recommendation_cache.stats(), 'decks': decks.stats()}), 200
+
 # USER AUTHENTICATION ENDPOINTS
 @app.route('/register', methods=['POST'])
 def register():
@@ -300,8 +433,8 @@ def register():
     food_preferences = data['food_preferences']
     place_preferences = data['place_preferences']
 
-    food_embbeding = vect.create_embeddings_from_preferences(food_preferences,1)
-    place_embbeding = vect.create_embeddings_from_preferences(place_preferences)
+    food_embbeding = preference_embedding(food_preferences,1)
+    place_embbeding = preference_embedding(place_preferences)
 
     # Hash the password
     hashed_password = hash_password(password)
@@ -331,6 +464,7 @@ def register():
         )
 
         conn.commit()
+        user_vectors_changed(username)
         
         return jsonify({'message': 'User registered successfully'}), 201
     
@@ -600,34 +734,35 @@ def get_user_groups(username):
 # RESTAURANT ENDPOINTS
 @app.route('/restaurants', methods=['GET'])
 def get_restaurants():
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    
     try:
-        cursor.execute("SELECT * FROM restaurant")
-        restaurants = cursor.fetchall()
-        
-        # Get images for each restaurant
-        for restaurant in restaurants:
-            restaurant_id = restaurant['restaurant_id']  # Changed from 'id' to 'restaurant_id'
-            cursor.execute("SELECT image_url FROM restaurant_image WHERE restaurant_id = %s", (restaurant_id,))
-            images = cursor.fetchall()
-            restaurant['images'] = [img['image_url'] for img in images]
-            restaurant['rating'] = float(restaurant['rating'])  # Convert Decimal to float for JSON
-        
-        return jsonify({'restaurants': restaurants}), 200
+        return jsonify({'restaurants': list(catalogue.records().values())}), 200
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    
-    finally:
-        cursor.close()
-        conn.close()
 
 
 # RESTAURANT FOR USER ENDPOINTS
 @app.route('/restaurants/<username>', methods=['GET'])
 def get_restaurants_preference(username):
+    # Refresh the catalogue first so its version reflects any pending reload
+    catalogue.records()
+    food_weight, place_weight = score_weights()
+    cache_key = (username, user_vector_versions.get(username), catalogue.version, food_weight, place_weight)
+    cached = recommendation_cache.get(cache_key)
+    if cached is not None:
+        return jsonify({'restaurants': cached}), 200
+
+    # Serve the precomputed deck, falling back to scoring in the request
+    default_weights = (food_weight, place_weight) == (FOOD_WEIGHT, PLACE_WEIGHT)
+    scored_ids = decks.deck(username) if default_weights else None
+    if scored_ids is not None:
+        restaurants = catalogue.lookup([restaurant_id for restaurant_id, _ in scored_ids])
+        out_restaurants = [deck_entry(restaurant) for restaurant in restaurants]
+        recommendation_cache.put(cache_key, out_restaurants)
+        return jsonify({'restaurants': out_restaurants}), 200
+    if default_weights:
+        decks.mark_dirty(username)
+
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -636,7 +771,7 @@ def get_restaurants_preference(username):
 
         response = cursor.fetchall()
         if len(response) != 0 :
-            history_food_vector, history_place_vector = cursor.fetchall()[0]
+            history_food_vector, history_place_vector = response[0]
             history_food_vector = json.loads(history_food_vector)
             history_place_vector = json.loads(history_place_vector)
         
@@ -647,70 +782,18 @@ def get_restaurants_preference(username):
         if len(response) != 0:
             place_vector = vect.average_embedding([history_place_vector,place_vector])
 
-        print(type(place_vector))
-        print(place_vector)
-
-        cursor1 = conn.cursor(dictionary=True)
-
-        cursor1.execute("Set @query_vec = (%s):> VECTOR(4096)",(json.dumps(place_vector),))
-
-        cursor1.execute("SELECT *, place_vector <*> @query_vec AS score FROM restaurant ORDER BY score DESC LIMIT 5")
-
-        restaurants = cursor.fetchall()
-        print(food_vector)
         food_vector = json.loads(food_vector)
 
         if len(response) != 0:
             food_vector = vect.average_embedding([history_food_vector,food_vector])
-        cursor1.execute("Set @query_vec = (%s):> VECTOR(4096)",(json.dumps(food_vector),))
 
-        print("1234")
+        # One fused food + place pass, already deduplicated
+        index = get_restaurant_index(conn)
+        scored_ids = index.search_fused(food_vector, place_vector, DECK_SIZE, food_weight, place_weight)
 
-        cursor1.execute("SELECT *, food_vector <*> @query_vec AS score FROM restaurant ORDER BY score DESC LIMIT 5")
-
-
-        print("123213123")
-        restaurants = restaurants + cursor1.fetchall()
-        restaurants_no_doubles = []
-        for item in restaurants:
-            if restaurants.count(item) > 1 and item not in restaurants_no_doubles:
-                restaurants_no_doubles.append(item)
-
-        print("123323")
-        # Get images for each restaurant
-        out_restaurants = []
-        for restaurant in restaurants:
-            print(len(restaurant))
-            restaurant_id, restaurant_name,rating, url,_,_,price_range_max,price_range_min,price_level,_,_,_,summary,_ = restaurant
-
-            print(restaurant_id)
-            cursor1.execute("SELECT url FROM photo WHERE restaurant_id = %s LIMIT 1", (restaurant_id,))
-            print("HOLLLAAA")
-            images = cursor1.fetchall()
-            if price_range_min == 0:
-                out_restaurant = {
-                'restaurant_name': restaurant_name,
-                'rating': rating,
-                'url':url,
-                'price_level':price_level,
-                'summary':summary,
-                'images': [img['url'] for img in images],
-                'price_range': "" 
-
-            }
-            else :
-                out_restaurant = {
-                    'restaurant_name': restaurant_name,
-                    'rating': rating,
-                    'url':url,
-                    'price_level':price_level,
-                    'summary':summary,
-                    'images': [img['url'] for img in images],
-                    'price_range': "(" + str(price_range_min) + "€-" + str(price_range_max) + "€)" 
-
-                }
-            print(out_restaurant['restaurant_name'])
-            out_restaurants.append(out_restaurant)
+        restaurants = catalogue.lookup([restaurant_id for restaurant_id, _ in scored_ids], conn)
+        out_restaurants = [deck_entry(restaurant) for restaurant in restaurants]
+        recommendation_cache.put(cache_key, out_restaurants)
 
         return jsonify({'restaurants': out_restaurants}), 200
     
@@ -718,7 +801,6 @@ def get_restaurants_preference(username):
         return jsonify({'error': str(e)}), 500
     
     finally:
-        cursor1.close()
         cursor.close()
         conn.close()
 
@@ -730,14 +812,10 @@ def get_users():
     try:
         cursor.execute("SELECT username, name, email FROM user")
         users = cursor.fetchall()
-        
+
+        preferences = bq.preferences_by_user(conn, [user['username'] for user in users])
         for user in users:
-            cursor.execute(
-                "SELECT preference FROM user_preference WHERE username = %s",
-                (user['username'],)
-            )
-            preferences = [row['preference'] for row in cursor.fetchall()]
-            user['preferences'] = preferences
+            user['preferences'] = preferences[user['username']]
 
         return jsonify({'users': users}), 200
     
@@ -761,6 +839,8 @@ def add_restaurant():
     rating = data['rating']
     url_location = data['url_location']
     image_urls = data.get('image_urls', [])
+    food_vector = data.get('food_vector')
+    place_vector = data.get('place_vector')
     
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -768,9 +848,11 @@ def add_restaurant():
     try:
         # Add restaurant
         cursor.execute("""
-            INSERT INTO restaurant (restaurant_id, name, rating, url_location)
-            VALUES (%s, %s, %s, %s)
-        """, (restaurant_id, name, rating, url_location))
+            INSERT INTO restaurant (restaurant_id, name, rating, url_location, food_vector, place_vector)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (restaurant_id, name, rating, url_location,
+              json.dumps(food_vector) if food_vector else None,
+              json.dumps(place_vector) if place_vector else None))
         
         # Add images
         for image_url in image_urls:
@@ -779,7 +861,12 @@ def add_restaurant():
                 VALUES (%s, %s)
             """, (restaurant_id, image_url))
         
+        stamp = cat.bump_version(cursor)
         conn.commit()
+        # Our own write: reload the records but keep the index (updated below) and the decks
+        catalogue.invalidate(stamp)
+        add_to_restaurant_index(restaurant_id, food_vector, place_vector, conn)
+        decks.rebuild_all()
         
         return jsonify({
             'message': 'Restaurant added successfully',
@@ -1066,6 +1153,10 @@ def update_group_status(code):
 # Endpoint para iniciar a seleção de restaurantes
 @app.route('/groups/<code>/start', methods=['POST'])
 def start_restaurant_selection(code):
+    aggregation = request.args.get('aggregation', GROUP_AGGREGATION)
+    if aggregation not in group_ranking.AGGREGATIONS:
+        return jsonify({'error': f"Unknown aggregation, expected one of {sorted(group_ranking.AGGREGATIONS)}"}), 400
+
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     cursor1 = conn.cursor()
@@ -1095,53 +1186,15 @@ def start_restaurant_selection(code):
         )
         conn.commit()
 
+        # Query vectors of every member, one row each
         cursor1.execute('''
-            SELECT place_vector, food_vector FROM user WHERE username 
+            SELECT food_vector, place_vector FROM user WHERE username 
             IN (SELECT username FROM group_user WHERE group_code = %s)
         ''',(code,))
 
-        result = cursor1.fetchall()
-        print(result,len(result[0]),len(result[1]))
-        #zipped = zip(*result)
-
-#        cursor.execute('''
-#            SELECT  history_place_vector, history_food_vector FROM user WHERE username 
-#            IN (SELECT username FROM group_user WHERE group_code = %s )
-#        ''',(code,))
-
-#        zipped1 = zip(*cursor.fetchall())
-        
-        place_vector = []
-        food_vector = []
-        history_place_vector = []
-        history_food_vector = []
-
-        temp_place_vector = [result[0][0],result[1][0]]
-        temp_food_vector = [result[0][1],result[1][1]]
-
-#        temp_history_place_vector = zipped1[0]
-#        temp_history_food_vector = zipped1[1]
-
-        for vector in temp_place_vector:
-            place_vector.append(json.loads(vector))
-        for vector in temp_food_vector:
-            food_vector.append(json.loads(vector))
- #       for vector in temp_history_place_vector:
- #           history_place_vector.append(json.loads(vector))
- #       for vector in temp_history_food_vector:
- #           history_food_vector.append(json.loads(vector))
-
-        place_vector = vect.average_embedding(place_vector)
-        food_vector = vect.average_embedding(food_vector)
-    
-#        history_place_vector = vect.average_embedding(history_place_vector)
-#        history_food_vector = vect.average_embedding(history_food_vector)
-
-#        place_vector = [place_vector,history_place_vector]
-#        food_vector = [food_vector,history_food_vector]
-        
-#        place_vector = vect.average_embedding(place_vector)
-#        food_vector = vect.average_embedding(food_vector)
+        members = cursor1.fetchall()
+        food_vectors = np.stack([vindex.parse_vector(food, vindex.VECTOR_DIM) for food, _ in members])
+        place_vectors = np.stack([vindex.parse_vector(place, vindex.VECTOR_DIM) for _, place in members])
 
         # Emitir evento para todos os membros do grupo
         socketio.emit('selection_started', {
@@ -1150,59 +1203,14 @@ def start_restaurant_selection(code):
         }, room=code)
 
         
-        cursor1.execute("Set @query_vec = (%s):> VECTOR(4096)",(json.dumps(place_vector),))
-
-        cursor1.execute("SELECT *, place_vector <*> @query_vec AS score FROM restaurant ORDER BY score DESC LIMIT 5")
-
-        restaurants = cursor1.fetchall()
-
-        cursor1.execute("Set @query_vec = (%s):> VECTOR(4096)",(json.dumps(food_vector),))
+        # Score all members against all restaurants at once and fold into one group ranking
+        food_weight, place_weight = score_weights()
+        index = get_restaurant_index(conn)
+        scored_ids = group_ranking.rank_group(index, food_vectors, place_vectors, DECK_SIZE, aggregation,
+                                              food_weight, place_weight)
 
-        cursor1.execute("SELECT *, food_vector <*> @query_vec AS score FROM restaurant ORDER BY score DESC LIMIT 5")
-
-        restaurants = restaurants + cursor1.fetchall()
-
-        restaurants_no_doubles = []
-        for item in restaurants:
-            if restaurants.count(item) > 1 and item not in restaurants_no_doubles:
-                restaurants_no_doubles.append(item)
-
-        out_restaurants = []
-        for restaurant in restaurants:
-            print(len(restaurant))
-            #if len(restaurant) < 14:
-             #   continue
-            restaurant_id, restaurant_name,rating, url,_,_,price_range_max,price_range_min,price_level,_,_,_,summary,_ = restaurant
-
-            print(restaurant_id)
-            cursor.execute("SELECT url FROM photo WHERE restaurant_id = %s LIMIT 1", (restaurant_id,))
-            images = cursor.fetchall()
-            if price_range_min == 0:
-                out_restaurant = {
-                'restaurant_name': restaurant_name,
-                'rating': rating,
-                'url':url,
-                'price_level':price_level,
-                'summary':summary,
-                'images': [img['url'] for img in images],
-                'price_range': "" 
-
-            }
-            else :
-                out_restaurant = {
-                    'restaurant_name': restaurant_name,
-                    'rating': rating,
-                    'url':url,
-                    'price_level':price_level,
-                    'summary':summary,
-                    'images': [img['url'] for img in images],
-                    'price_range': "(" + str(price_range_min) + "€-" + str(price_range_max) + "€)" 
-
-                }
-            print(out_restaurant['restaurant_name'])
-            out_restaurants.append(out_restaurant)
-
-        print("FINALLL \n\n\n\n\n\n")
+        restaurants = catalogue.lookup([restaurant_id for restaurant_id, _ in scored_ids], conn)
+        out_restaurants = [deck_entry(restaurant) for restaurant in restaurants]
         
         return jsonify({'restaurants':out_restaurants}), 200
 
@@ -1255,7 +1263,50 @@ def update_user_preferences(username):
     preferences = data['preferences']
     if not isinstance(preferences, list):
         return jsonify({'error': 'Preferences must be a list'}), 400
-    
+
+    food_preferences = [pref for pref in preferences if pref in tags.FOOD_TAGS]
+    place_preferences = [pref for pref in preferences if pref not in tags.FOOD_TAGS]
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        # Validate user exists before paying for any embedding
+        cursor.execute("SELECT username FROM user WHERE username = %s", (username,))
+        if not cursor.fetchone():
+            return jsonify({'error': 'User not found'}), 404
+
+        # A side without tags keeps its current vector
+        columns = []
+        values = []
+        if food_preferences:
+            columns.append("food_vector = %s")
+            values.append(json.dumps(preference_embedding(food_preferences,1)))
+        if place_preferences:
+            columns.append("place_vector = %s")
+            values.append(json.dumps(preference_embedding(place_preferences)))
+        if columns:
+            cursor.execute(f"UPDATE user SET {', '.join(columns)} WHERE username = %s", (*values, username))
+
+        cursor.execute("DELETE FROM user_preference WHERE username = %s", (username,))
+        for pref in preferences:
+            cursor.execute("INSERT INTO user_preference (username, preference) VALUES (%s, %s)",
+                (username, pref)
+            )
+
+        conn.commit()
+        user_vectors_changed(username)
+
+        return jsonify({'preferences': preferences}), 200
+
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+
+    finally:
+        cursor.close()
+        conn.close()
+
 
 @socketio.on('restaurant_vote')
 def handle_restaurant_vote(data):
@@ -1293,8 +1344,8 @@ def handle_restaurant_vote(data):
         
         conn.commit()
         
-        # Check if this vote created a match
-        check_for_restaurant_match(room, restaurant_id)
+        # Check if this vote created a match, reusing this connection
+        check_for_restaurant_match(room, restaurant_id, conn)
         
     except Exception as e:
         print(f"Error handling restaurant vote: {e}")
@@ -1311,9 +1362,11 @@ def update_user_profile(username):
     # Check for required fields
     if not data or not any(k in data for k in ('name', 'email')):
         return jsonify({'error': 'No profile data provided'}), 400
-def check_for_restaurant_match(group_code, restaurant_id):
+def check_for_restaurant_match(group_code, restaurant_id, conn=None):
     """Check if all group members liked the same restaurant"""
-    conn = get_db_connection()
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     
     try:
@@ -1344,8 +1397,7 @@ def check_for_restaurant_match(group_code, restaurant_id):
             print(f"MATCH FOUND! All {total_members} members in group {group_code} liked restaurant {restaurant_id}")
             
             # Get restaurant details
-            cursor.execute("SELECT name FROM restaurant WHERE restaurant_id = %s", (restaurant_id,))
-            restaurant = cursor.fetchone()
+            restaurant = catalogue.get(restaurant_id, conn)
             restaurant_name = restaurant['name'] if restaurant else "Unknown restaurant"
             
             # Emit match event to all group members
@@ -1366,7 +1418,8 @@ def check_for_restaurant_match(group_code, restaurant_id):
         print(f"Error checking for restaurant match: {e}")
     finally:
         cursor.close()
-        conn.close()
+        if own_conn:
+            conn.close()
 
 # Add endpoint to get restaurants for selection
 @app.route('/groups/<code>/restaurants', methods=['GET'])
@@ -1384,39 +1437,16 @@ def get_group_restaurants(code):
             return jsonify({'error': 'Group not found'}), 404
         
         # For a real implementation, you would fetch restaurants based on group preferences
-        # Here, we'll just get all restaurants with their images
-        cursor.execute("""
-            SELECT r.*, 
-                   (SELECT COUNT(*) FROM user_restaurant ur 
-                    JOIN group_user gu ON ur.username = gu.username 
-                    WHERE ur.restaurant_id = r.restaurant_id AND gu.group_code = %s) as like_count
-            FROM restaurant r
-            LIMIT 10
-        """, (code,))
-        
-        restaurants = cursor.fetchall()
-        
-        # Get images for each restaurant
-        for restaurant in restaurants:
-            restaurant_id = restaurant['restaurant_id']
-            cursor.execute("SELECT url FROM photo WHERE restaurant_id = %s LIMIT 5", (restaurant_id,))
-            photos = cursor.fetchall()
-            restaurant['photos'] = [photo['url'] for photo in photos]
-            
-            # Get users who liked this restaurant
-            cursor.execute("""
-                SELECT ur.username 
-                FROM user_restaurant ur
-                JOIN group_user gu ON ur.username = gu.username
-                WHERE ur.restaurant_id = %s AND gu.group_code = %s
-            """, (restaurant_id, code))
-            
-            likes = cursor.fetchall()
-            restaurant['likes'] = [like['username'] for like in likes]
-            
-            # Convert decimal to float for JSON serialization
-            if 'rating' in restaurant:
-                restaurant['rating'] = float(restaurant['rating'])
+        # Here, we'll just get the first restaurants of the catalogue with their images
+        records = list(catalogue.records(conn).values())[:10]
+
+        # Likes change with every vote, so they are read from the database in one query
+        likes = bq.group_likes_by_restaurant(conn, code, [record['restaurant_id'] for record in records])
+        restaurants = []
+        for record in records:
+            restaurant_likes = likes[record['restaurant_id']]
+            restaurants.append(dict(record, photos=record['photos'][:5],
+                                    likes=restaurant_likes, like_count=len(restaurant_likes)))
         
         return jsonify({'restaurants': restaurants}), 200
         
@@ -1475,24 +1505,35 @@ def complete_match(username):
         data = request.get_json()
         restaurant_id = data['restaurant_id']
 
-        cursor.execute("INSERT INTO user_history (username, restaurant_id) VALUES (%s, %s)",username, restaurant_id)
-
-        cursor.execute('''SELECT place_vector, food_vector FROM restaurant WHERE restaurant_id 
-                        IN (SELECT restaurant_id FROM user_history WHERE user = %s)''',(username,))
-        
-        zipped = zip(*cursor.fetchall())
-        place_vector = []
-        food_vector = []
-        temp_place_vector = zipped[0]
-        temp_food_vector = zipped[1]
-        for vector in temp_place_vector:
-            place_vector.append(json.loads(vector))
-        for vector in temp_food_vector:
-            food_vector.append(json.loads(vector))
+        # Lock the user row until the commit, so concurrent matches fold in one after another
+        cursor.execute("SELECT history_place_vector, history_food_vector, history FROM user WHERE username = %s FOR UPDATE",
+                       (username,))
+        user_row = cursor.fetchone()
+        cursor.execute("SELECT place_vector, food_vector FROM restaurant WHERE restaurant_id = %s", (restaurant_id,))
+        restaurant_row = cursor.fetchone()
+        if not user_row or not restaurant_row:
+            conn.rollback()
+            return jsonify({'error': 'User or restaurant not found'}), 404
+
+        history_place_vector, history_food_vector, history = user_row
+        place_vector, food_vector = restaurant_row
+        history = history or 0
+        decay = float(os.getenv("HISTORY_DECAY", "0"))
+
+        # Fold the new restaurant into the running history means in O(d)
+        place_vector = vect.update_mean(vindex.parse_vector(history_place_vector) if history else None,
+                                        history, vindex.parse_vector(place_vector), decay)
+        food_vector = vect.update_mean(vindex.parse_vector(history_food_vector) if history else None,
+                                       history, vindex.parse_vector(food_vector), decay)
+
+        cursor.execute("INSERT INTO user_history (username, restaurant_id) VALUES (%s, %s)",(username, restaurant_id))
+        cursor.execute("UPDATE user SET history_place_vector = %s, history_food_vector = %s, history = %s WHERE username = %s",
+                       (json.dumps(vect.vector_to_list(place_vector)),json.dumps(vect.vector_to_list(food_vector)),
+                        history + 1,username))
+        conn.commit()
+        user_vectors_changed(username)
 
-        place_vector = vect.average_embbeddings(place_vector)
-        food_vector = vect.average_embbeddings(food_vector)
-        cursor.execute("UPDATE user SET history_place_vector = %s, history_food_vector = %s, history = history + 1",(place_vector,food_vector,))
+        return jsonify({'message': 'Match recorded successfully'}), 200
 
     except Exception as e:
         conn.rollback()
@@ -1504,4 +1545,6 @@ def complete_match(username):
 
 
 if __name__ == '__main__':
+    decks.start()
+    decks.rebuild_all()
     socketio.run(app, debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
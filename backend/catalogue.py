@@ -0,0 +1,157 @@
+"""
+In-process, read-through cache of the restaurant catalogue: one compact
+record per restaurant with its metadata and photo URLs. Vectors are not
+kept here, they live in the restaurant vector index.
+
+The cache is reloaded when
+- this process writes to the catalogue and calls `invalidate()`,
+- another process (e.g. `populate.py`) bumps the stamp in `catalogue_version`,
+  checked at most every `check_interval` seconds,
+- or `ttl` seconds have passed since the last load, as a fallback.
+"""
+import time
+import threading
+import mysql.connector
+from mysql.connector import errorcode
+
+METADATA_COLUMNS = ("restaurant_id", "name", "rating", "url_location", "price_range_max", "price_range_min",
+                    "price_level", "type", "reservable", "vegetarian", "summary")
+
+VERSION_TABLE = '''
+    CREATE TABLE IF NOT EXISTS catalogue_version (
+        id INT PRIMARY KEY,
+        version BIGINT NOT NULL
+    )
+'''
+
+
+def bump_version(cursor):
+    """Tell every running backend that the restaurant or photo tables changed; returns the new stamp"""
+    cursor.execute(VERSION_TABLE)
+    cursor.execute("INSERT INTO catalogue_version (id, version) VALUES (1, 1) "
+                   "ON DUPLICATE KEY UPDATE version = version + 1")
+    cursor.execute("SELECT version FROM catalogue_version WHERE id = 1")
+    return cursor.fetchone()[0]
+
+
+def read_version(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT version FROM catalogue_version WHERE id = 1")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    except mysql.connector.Error as e:
+        if e.errno == errorcode.ER_NO_SUCH_TABLE:
+            return 0
+        raise
+    finally:
+        cursor.close()
+
+
+def load_records(conn):
+    """Return {restaurant_id: record} in table order, each with `photos` and `images` lists"""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f"SELECT {', '.join(METADATA_COLUMNS)} FROM restaurant")
+        records = {}
+        for row in cursor.fetchall():
+            row['rating'] = float(row['rating'])
+            row['photos'] = []
+            row['images'] = []
+            records[row['restaurant_id']] = row
+
+        cursor.execute("SELECT restaurant_id, url FROM photo")
+        for row in cursor.fetchall():
+            if row['restaurant_id'] in records:
+                records[row['restaurant_id']]['photos'].append(row['url'])
+
+        # restaurant_image only exists once add_restaurant has been used
+        try:
+            cursor.execute("SELECT restaurant_id, image_url FROM restaurant_image")
+            for row in cursor.fetchall():
+                if row['restaurant_id'] in records:
+                    records[row['restaurant_id']]['images'].append(row['image_url'])
+        except mysql.connector.Error as e:
+            if e.errno != errorcode.ER_NO_SUCH_TABLE:
+                raise
+        return records
+    finally:
+        cursor.close()
+
+
+class Catalogue:
+    """
+    `get_connection` returns a connection whose `close()` gives it back.
+    `version` goes up on every reload, so it can key caches derived from the catalogue.
+    `on_change` is called when a reload finds a new stamp, so state built from the
+    same tables (the vector index, precomputed decks) can be dropped as well.
+
+    Readers already holding a pooled connection pass it as `conn`, so a reload
+    never waits for a second connection while other readers wait on the lock.
+    """
+
+    def __init__(self, get_connection, ttl = 3600.0, check_interval = 30.0, on_change = None):
+        self._get_connection = get_connection
+        self.on_change = on_change
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._records = None
+        self._stamp = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self.version = 0
+
+    def invalidate(self, own_stamp = None):
+        """
+        Reload on next use. `own_stamp` is the stamp returned by this process's
+        own `bump_version`: if it directly follows the known stamp, the reload
+        does not count as a change from elsewhere and `on_change` is not called.
+        """
+        with self._lock:
+            self._records = None
+            if own_stamp is not None and self._stamp is not None and own_stamp == self._stamp + 1:
+                self._stamp = own_stamp
+
+    def _stale(self, conn, now):
+        if self._records is None or now - self._loaded_at >= self.ttl:
+            return True
+        if now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        return read_version(conn) != self._stamp
+
+    def records(self, conn = None):
+        """Return the current {restaurant_id: record} snapshot, reloading it if stale"""
+        records = self._records
+        now = time.monotonic()
+        if records is not None and now - self._loaded_at < self.ttl and now - self._checked_at < self.check_interval:
+            return records
+
+        with self._lock:
+            own_conn = conn is None
+            if own_conn:
+                conn = self._get_connection()
+            try:
+                if self._stale(conn, now):
+                    # Read the stamp first so a write racing the load triggers another reload
+                    stamp = read_version(conn)
+                    changed = self._stamp is not None and stamp != self._stamp
+                    self._stamp = stamp
+                    self._records = load_records(conn)
+                    self._loaded_at = self._checked_at = time.monotonic()
+                    if changed and self.on_change is not None:
+                        self.on_change()
+                    self.version += 1
+            finally:
+                if own_conn:
+                    conn.close()
+            return self._records
+
+    def get(self, restaurant_id, conn = None):
+        return self.records(conn).get(restaurant_id)
+
+    def lookup(self, restaurant_ids, conn = None):
+        """Records of the given ids, in order, skipping ids not in the catalogue"""
+        records = self.records(conn)
+        return [records[i] for i in restaurant_ids if i in records]
@@ -0,0 +1,173 @@
+import os
+import time
+import queue
+import threading
+import mysql.connector
+
+
+def connect():
+    """Open a new connection to the SingleStore database"""
+    return mysql.connector.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USERNAME"),
+        password=os.getenv("DB_PASSWORD"),
+        database=os.getenv("DB_DATABASE"),
+        port=int(os.getenv("DB_PORT"))
+    )
+
+
+class PooledConnection:
+    """
+    Proxy around a pooled connection: `close()` hands it back to the pool
+    instead of closing the socket, everything else goes to the real connection.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise mysql.connector.errors.OperationalError("Connection was returned to the pool")
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of database connections shared by the Flask routes and
+    the socket handlers. Connections are opened lazily up to `size`; after
+    that callers wait up to `timeout` seconds for one to be returned.
+
+    A connection idle for more than `ping_after` seconds is pinged on
+    checkout and replaced if the server dropped it.
+    """
+
+    def __init__(self, connect = connect, size = 10, timeout = 30.0, ping_after = 5.0):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+        # Metrics
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.reconnects = 0
+
+    def _open(self):
+        conn = self._connect()
+        return conn, time.monotonic()
+
+    def _healthy(self, conn, last_used):
+        if time.monotonic() - last_used < self.ping_after:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def connection(self):
+        """Check out a connection; call `close()` on it to give it back"""
+        start = time.monotonic()
+        conn = None
+        try:
+            conn, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._created < self.size
+                if can_open:
+                    self._created += 1
+            if can_open:
+                try:
+                    conn, last_used = self._open()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn, last_used = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise mysql.connector.errors.PoolError(
+                        f"No database connection available after {self.timeout}s")
+                waited = time.monotonic() - start
+                with self._lock:
+                    self.waits += 1
+                    self.wait_time += waited
+                    self.max_wait = max(self.max_wait, waited)
+
+        if not self._healthy(conn, last_used):
+            self._discard(conn)
+            with self._lock:
+                self._created += 1
+                self.reconnects += 1
+            try:
+                conn, last_used = self._open()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        with self._lock:
+            self.checkouts += 1
+        return PooledConnection(self, conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def release(self, conn):
+        # Never hand out an open transaction: it would leak writes or a stale snapshot
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except mysql.connector.Error:
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    def stats(self):
+        with self._lock:
+            return {"size": self.size,
+                    "open": self._created,
+                    "idle": self._idle.qsize(),
+                    "checkouts": self.checkouts,
+                    "waits": self.waits,
+                    "avg_wait_ms": 1000 * self.wait_time / self.waits if self.waits else 0.0,
+                    "max_wait_ms": 1000 * self.max_wait,
+                    "reconnects": self.reconnects}
+
+
+pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, sized from DB_POOL_SIZE / DB_POOL_TIMEOUT"""
+    global pool
+    with _pool_lock:
+        if pool is None:
+            pool = ConnectionPool(size=int(os.getenv("DB_POOL_SIZE", 10)),
+                                  timeout=float(os.getenv("DB_POOL_TIMEOUT", 30)),
+                                  ping_after=float(os.getenv("DB_POOL_PING_AFTER", 5)))
+    return pool
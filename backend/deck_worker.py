@@ -0,0 +1,167 @@
+"""
+Background materialization of per-user recommendation decks.
+
+A single worker thread scores users in batches: the query vectors of a
+whole batch are stacked and scored against every restaurant with one
+fused food + place matrix-matrix product. Users whose vectors changed are
+recomputed as soon as they are marked dirty; every user is recomputed in
+a nightly full rebuild. Request handlers only read the stored decks.
+"""
+import time
+import datetime
+import threading
+import numpy as np
+
+import vector_index as vindex
+
+USER_VECTORS_QUERY = '''
+    SELECT username, food_vector, place_vector, history_food_vector, history_place_vector, history
+    FROM user WHERE username IN ({ids})
+'''
+
+
+def seconds_until(hour):
+    """Seconds from now until the next local `hour`:00"""
+    now = datetime.datetime.now()
+    target = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if target <= now:
+        target += datetime.timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+def query_vectors(rows, dim = vindex.VECTOR_DIM):
+    """
+    Stack the food and place query vectors of user rows. Users with a match
+    history query with the mean of their preference and history vectors,
+    like the synchronous recommendation path.
+    """
+    food = np.stack([vindex.parse_vector(row[1], dim) for row in rows])
+    place = np.stack([vindex.parse_vector(row[2], dim) for row in rows])
+    has_history = np.array([bool(row[5]) for row in rows])
+    if has_history.any():
+        history_food = np.stack([vindex.parse_vector(row[3], dim) if row[5] else np.zeros(dim, dtype=np.float32)
+                                 for row in rows])
+        history_place = np.stack([vindex.parse_vector(row[4], dim) if row[5] else np.zeros(dim, dtype=np.float32)
+                                  for row in rows])
+        food[has_history] = (food[has_history] + history_food[has_history]) / 2
+        place[has_history] = (place[has_history] + history_place[has_history]) / 2
+    return food, place
+
+
+class DeckWorker:
+    """
+    `get_connection` returns a connection whose `close()` gives it back,
+    `get_index` the current RestaurantIndex and `versions` the per-user
+    VersionMap; a deck is only served while its user's version is unchanged.
+    """
+
+    def __init__(self, get_connection, get_index, versions, deck_size = 10, food_weight = 1.0, place_weight = 1.0,
+                 batch_size = 256, rebuild_hour = 3):
+        self._get_connection = get_connection
+        self._get_index = get_index
+        self.versions = versions
+        self.deck_size = deck_size
+        self.food_weight = food_weight
+        self.place_weight = place_weight
+        self.batch_size = batch_size
+        self.rebuild_hour = rebuild_hour
+        self._decks = {}
+        self._dirty = set()
+        self._rebuild = False
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Metrics
+        self.users_scored = 0
+        self.last_rebuild_seconds = None
+        self.last_rebuild_at = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="deck-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+
+    def mark_dirty(self, username):
+        with self._cond:
+            self._dirty.add(username)
+            self._cond.notify()
+
+    def rebuild_all(self, clear = False):
+        """Recompute every deck; with `clear`, stop serving the current ones meanwhile"""
+        with self._cond:
+            if clear:
+                self._decks = {}
+            self._rebuild = True
+            self._cond.notify()
+
+    def deck(self, username):
+        """Return the stored [(restaurant_id, score), ...] deck, or None if missing or stale"""
+        entry = self._decks.get(username)
+        if entry is None or entry[0] != self.versions.get(username):
+            return None
+        return entry[1]
+
+    def _run(self):
+        next_rebuild = time.time() + seconds_until(self.rebuild_hour)
+        while not self._stop.is_set():
+            with self._cond:
+                if not self._dirty and not self._rebuild:
+                    self._cond.wait(max(0.0, next_rebuild - time.time()))
+                full = self._rebuild or time.time() >= next_rebuild
+                dirty = self._dirty
+                self._dirty = set()
+                self._rebuild = False
+            if self._stop.is_set():
+                return
+
+            try:
+                if full:
+                    next_rebuild = time.time() + seconds_until(self.rebuild_hour)
+                    start = time.perf_counter()
+                    self.materialize(None)
+                    self.last_rebuild_seconds = time.perf_counter() - start
+                    self.last_rebuild_at = datetime.datetime.now().isoformat(timespec="seconds")
+                elif dirty:
+                    self.materialize(dirty)
+            except Exception as e:
+                print(f"Error materializing recommendation decks: {e}")
+
+    def materialize(self, usernames = None):
+        """Recompute the decks of `usernames`, or of every user when None"""
+        # Loading the index may check out a connection, so it happens before we hold ours
+        index = self._get_index()
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        try:
+            if usernames is None:
+                cursor.execute("SELECT username FROM user")
+                usernames = [row[0] for row in cursor.fetchall()]
+            usernames = list(usernames)
+
+            for i in range(0, len(usernames), self.batch_size):
+                batch = usernames[i:i + self.batch_size]
+                # Versions are read before the vectors, so a concurrent update leaves the deck stale, not wrong
+                versions = {username: self.versions.get(username) for username in batch}
+                cursor.execute(USER_VECTORS_QUERY.format(ids=", ".join(["%s"] * len(batch))), tuple(batch))
+                rows = cursor.fetchall()
+                if not rows:
+                    continue
+
+                food, place = query_vectors(rows, index.food.dim)
+                top = index.search_fused_batch(food, place, self.deck_size, self.food_weight, self.place_weight)
+                for row, deck in zip(rows, top):
+                    self._decks[row[0]] = (versions[row[0]], deck)
+                self.users_scored += len(rows)
+        finally:
+            cursor.close()
+            conn.close()
+
+    def stats(self):
+        return {"decks": len(self._decks), "pending": len(self._dirty), "users_scored": self.users_scored,
+                "last_rebuild_seconds": self.last_rebuild_seconds, "last_rebuild_at": self.last_rebuild_at}
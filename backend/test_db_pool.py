@@ -0,0 +1,136 @@
+"""
+ConnectionPool checkout, timeout, release and reconnect accounting with a fake `connect`.
+"""
+import threading
+import time
+
+import mysql.connector
+import pytest
+
+import db_pool
+
+
+class FakeConnection:
+
+    def __init__(self, n):
+        self.n = n
+        self.in_transaction = False
+        self.rollbacks = 0
+        self.closed = False
+        self.alive = True
+        self.fail_rollback = False
+
+    def ping(self, reconnect = False):
+        if not self.alive:
+            raise mysql.connector.errors.InterfaceError("Connection lost")
+
+    def rollback(self):
+        if self.fail_rollback:
+            raise mysql.connector.errors.OperationalError("Connection lost")
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnect:
+
+    def __init__(self):
+        self.opened = []
+        self.fail = False
+
+    def __call__(self):
+        if self.fail:
+            raise mysql.connector.errors.InterfaceError("Can't connect")
+        conn = FakeConnection(len(self.opened))
+        self.opened.append(conn)
+        return conn
+
+
+def make_pool(size = 2, timeout = 0.2, ping_after = 60.0):
+    connect = FakeConnect()
+    return db_pool.ConnectionPool(connect, size=size, timeout=timeout, ping_after=ping_after), connect
+
+
+def test_connections_are_opened_lazily_and_reused():
+    pool, connect = make_pool()
+    first = pool.connection()
+    first.close()
+    second = pool.connection()
+    assert len(connect.opened) == 1
+    assert second.n == 0
+    second.close()
+    assert pool.stats()["checkouts"] == 2 and pool.stats()["idle"] == 1
+
+
+def test_exhausted_pool_times_out():
+    pool, connect = make_pool(size=1, timeout=0.1)
+    held = pool.connection()
+    start = time.monotonic()
+    with pytest.raises(mysql.connector.errors.PoolError):
+        pool.connection()
+    assert time.monotonic() - start >= 0.1
+    assert len(connect.opened) == 1 and pool.stats()["open"] == 1
+    held.close()
+
+
+def test_waiter_gets_the_released_connection():
+    pool, _ = make_pool(size=1, timeout=5.0)
+    held = pool.connection()
+    threading.Timer(0.05, held.close).start()
+    conn = pool.connection()
+    assert conn.n == 0
+    stats = pool.stats()
+    assert stats["waits"] == 1 and stats["max_wait_ms"] >= 40
+    conn.close()
+
+
+def test_release_rolls_back_open_transactions():
+    pool, connect = make_pool(size=1)
+    conn = pool.connection()
+    connect.opened[0].in_transaction = True
+    conn.close()
+    assert connect.opened[0].rollbacks == 1
+    assert pool.connection().in_transaction is False
+
+
+def test_release_discards_broken_connections():
+    pool, connect = make_pool(size=1)
+    conn = pool.connection()
+    connect.opened[0].in_transaction = True
+    connect.opened[0].fail_rollback = True
+    conn.close()
+    assert connect.opened[0].closed and pool.stats()["open"] == 0
+    # The slot is free again for a new connection
+    assert pool.connection().n == 1
+
+
+def test_closed_proxy_cannot_be_used():
+    pool, _ = make_pool()
+    conn = pool.connection()
+    conn.close()
+    conn.close()
+    assert pool.stats()["idle"] == 1
+    with pytest.raises(mysql.connector.errors.OperationalError):
+        conn.cursor()
+
+
+def test_stale_connection_is_replaced():
+    pool, connect = make_pool(size=1, ping_after=0.0)
+    pool.connection().close()
+    connect.opened[0].alive = False
+    conn = pool.connection()
+    assert conn.n == 1 and connect.opened[0].closed
+    stats = pool.stats()
+    assert stats["reconnects"] == 1 and stats["open"] == 1
+
+
+def test_failed_connect_frees_its_slot():
+    pool, connect = make_pool(size=1)
+    connect.fail = True
+    with pytest.raises(mysql.connector.errors.InterfaceError):
+        pool.connection()
+    assert pool.stats()["open"] == 0
+    connect.fail = False
+    assert pool.connection().n == 0
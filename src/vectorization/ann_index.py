@@ -0,0 +1,267 @@
+"""
+Inverted file (IVF) approximate nearest-neighbour index for restaurant vectors.
+
+Vectors are clustered with spherical k-means; a query only scores the
+vectors of the `n_probe` clusters whose centroids match it best.
+"""
+import os
+import sys
+import time
+import numpy as np
+
+from vector_index import top_k, parse_vector, VectorIndex, RestaurantIndex, VECTOR_DIM
+import vector_store as vstore
+
+# Relative ANN_INDEX_PATH values are taken from the repository root, so the backend
+# (run from the root) and populate.py (run from src/webscrapping) share one file
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def spherical_kmeans(vectors, n_lists, n_iter = 10, seed = 0):
+    """
+    Cluster vectors by cosine similarity, returns unit-norm centroids.
+    """
+    rng = np.random.default_rng(seed)
+    unit = _normalize(np.asarray(vectors, dtype=np.float32))
+    n_lists = max(1, min(n_lists, len(unit)))
+    centroids = unit[rng.choice(len(unit), n_lists, replace=False)]
+
+    for _ in range(n_iter):
+        assignment = np.argmax(unit @ centroids.T, axis=1)
+        for c in range(n_lists):
+            members = unit[assignment == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                # Re-seed empty clusters with a random vector
+                centroids[c] = unit[rng.integers(len(unit))]
+        centroids = _normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """
+    Dot-product IVF index with incremental inserts. Each list keeps its
+    vectors in one contiguous, geometrically grown buffer.
+    `n_probe` controls the search breadth: more lists, better recall, slower search.
+    """
+
+    def __init__(self, centroids, dim = VECTOR_DIM, n_probe = 4):
+        self.dim = dim
+        self.n_probe = n_probe
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.ids = []
+        self._list_ids = [[] for _ in range(len(self.centroids))]
+        self._list_vectors = [np.zeros((0, dim), dtype=np.float32) for _ in range(len(self.centroids))]
+        # id -> (list, row) of the stored vector, for exact re-scoring of candidates
+        self._positions = {}
+
+    @classmethod
+    def build(cls, ids, vectors, dim = VECTOR_DIM, n_lists = 16, n_probe = 4, n_iter = 10):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, dim)
+        centroids = spherical_kmeans(vectors, n_lists, n_iter) if len(vectors) else np.zeros((1, dim), dtype=np.float32)
+        index = cls(centroids, dim, n_probe)
+        index.add_batch(ids, vectors)
+        return index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add_batch(self, ids, vectors, assignment = None):
+        ids = list(ids)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if assignment is None:
+            assignment = np.argmax(vectors @ self.centroids.T, axis=1) if len(vectors) else []
+        assignment = np.asarray(assignment)
+        self.ids += ids
+
+        for c in np.unique(assignment):
+            rows = np.flatnonzero(assignment == c)
+            size = len(self._list_ids[c])
+            needed = size + len(rows)
+            buffer = self._list_vectors[c]
+            if needed > len(buffer):
+                # Grow geometrically so repeated single inserts stay amortized O(d)
+                grown = np.zeros((max(needed, 2 * len(buffer)), self.dim), dtype=np.float32)
+                grown[:size] = buffer[:size]
+                self._list_vectors[c] = buffer = grown
+            buffer[size:needed] = vectors[rows]
+            self._list_ids[c] += [ids[row] for row in rows]
+            for offset, row in enumerate(rows):
+                self._positions[ids[row]] = (c, size + offset)
+
+    def add(self, item_id, vector):
+        self.add_batch([item_id], [vector])
+
+    def remove(self, item_ids):
+        item_ids = set(item_ids)
+        self.ids = [i for i in self.ids if i not in item_ids]
+        for c, list_ids in enumerate(self._list_ids):
+            keep = [row for row, item_id in enumerate(list_ids) if item_id not in item_ids]
+            if len(keep) == len(list_ids):
+                continue
+            self._list_ids[c] = [list_ids[row] for row in keep]
+            self._list_vectors[c] = self._list_vectors[c][keep]
+            for row, item_id in enumerate(self._list_ids[c]):
+                self._positions[item_id] = (c, row)
+        for item_id in item_ids:
+            self._positions.pop(item_id, None)
+
+    def vectors(self, item_ids):
+        """Stored float32 vectors of `item_ids`, in order"""
+        out = np.empty((len(item_ids), self.dim), dtype=np.float32)
+        for r, item_id in enumerate(item_ids):
+            c, row = self._positions[item_id]
+            out[r] = self._list_vectors[c][row]
+        return out
+
+    def search(self, query, k = 5, n_probe = None):
+        query = np.asarray(query, dtype=np.float32)
+        ids, scores = [], []
+        for c in top_k(self.centroids @ query, n_probe or self.n_probe):
+            size = len(self._list_ids[c])
+            if size:
+                ids += self._list_ids[c]
+                scores.append(self._list_vectors[c][:size] @ query)
+        if not scores:
+            return []
+        scores = np.concatenate(scores)
+        return [(ids[i], float(scores[i])) for i in top_k(scores, k)]
+
+    def search_batch(self, queries, k = 5, n_probe = None):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        return [self.search(query, k, n_probe) for query in queries]
+
+    def state(self):
+        ids, vectors, assignment = [], [], []
+        for c, list_ids in enumerate(self._list_ids):
+            ids += list_ids
+            vectors.append(self._list_vectors[c][:len(list_ids)])
+            assignment += [c] * len(list_ids)
+        return {"ids": ids, "centroids": self.centroids, "vectors": np.concatenate(vectors),
+                "assignment": np.asarray(assignment, dtype=np.int32)}
+
+    @classmethod
+    def from_state(cls, ids, centroids, vectors, assignment, n_probe = 4):
+        index = cls(centroids, centroids.shape[1], n_probe)
+        index.add_batch(ids, vectors, assignment)
+        return index
+
+
+def build_restaurant_ann(ids, food_vectors, place_vectors, dim = VECTOR_DIM, n_lists = 16, n_probe = 4):
+    """
+    RestaurantIndex whose food and place searches go through IVF indexes.
+    """
+    food = IVFIndex.build(ids, food_vectors, dim, n_lists, n_probe)
+    place = IVFIndex.build(ids, place_vectors, dim, n_lists, n_probe)
+    return RestaurantIndex.from_parts(ids, food, place)
+
+
+def save_restaurant_ann(index, path):
+    """
+    Persist both IVF indexes of a RestaurantIndex to a single .npz file.
+    It is written through a file handle so numpy never appends `.npz` to
+    `path`, and swapped in atomically.
+    """
+    arrays = {"ids": np.asarray(index.ids, dtype=str)}
+    for kind in ("food", "place"):
+        state = getattr(index, kind).state()
+        arrays[kind + "_ids"] = np.asarray(state["ids"], dtype=str)
+        arrays[kind + "_centroids"] = state["centroids"]
+        arrays[kind + "_vectors"] = state["vectors"]
+        arrays[kind + "_assignment"] = state["assignment"]
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+def ann_index_path():
+    """ANN_INDEX_PATH as an absolute path, or None when unset"""
+    path = os.getenv("ANN_INDEX_PATH")
+    if not path:
+        return None
+    return path if os.path.isabs(path) else os.path.join(ROOT, path)
+
+
+def sync_restaurant_ann(index, conn, dim = VECTOR_DIM):
+    """
+    Bring a persisted index in line with the restaurant table: restaurants
+    added since it was saved are inserted, deleted ones removed.
+    Returns True if the index changed and should be saved again.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT restaurant_id FROM restaurant")
+        stored = {row[0] for row in cursor.fetchall()}
+        indexed = set(index.ids)
+        added = [restaurant_id for restaurant_id in stored if restaurant_id not in indexed]
+        removed = indexed - stored
+
+        for start in range(0, len(added), 500):
+            chunk = added[start:start + 500]
+            cursor.execute(f"SELECT restaurant_id, food_vector, place_vector FROM restaurant "
+                           f"WHERE restaurant_id IN ({', '.join(['%s'] * len(chunk))})", tuple(chunk))
+            for restaurant_id, food_vector, place_vector in cursor.fetchall():
+                index.add(restaurant_id, parse_vector(food_vector, dim), parse_vector(place_vector, dim))
+    finally:
+        cursor.close()
+
+    if removed:
+        index.remove(removed)
+    return bool(added or removed)
+
+
+def load_restaurant_ann(path, n_probe = 4):
+    data = np.load(path)
+    parts = []
+    for kind in ("food", "place"):
+        parts.append(IVFIndex.from_state(data[kind + "_ids"].tolist(), data[kind + "_centroids"],
+                                         data[kind + "_vectors"], data[kind + "_assignment"], n_probe))
+    return RestaurantIndex.from_parts(data["ids"].tolist(), *parts)
+
+
+def benchmark(paths, k = 5, n_lists = 16, n_probes = (1, 2, 4, 8), copies = 1, seed = 0):
+    """
+    Latency and recall@k of the IVF index against the exact scan, using the
+    place vectors of the given `proc_data_<city>` files. `copies` > 1 adds
+    jittered copies of every vector to simulate a larger catalogue.
+    """
+    rng = np.random.default_rng(seed)
+    ids, matrices = [], []
+    for path in paths:
+        city_ids, _, city_place = vstore.read_city_vectors(path)
+        ids += city_ids
+        matrices.append(city_place)
+    base = np.concatenate(matrices)
+
+    vectors = [base] + [base + rng.normal(0, base.std() * 0.3, base.shape).astype(np.float32) for _ in range(copies - 1)]
+    vectors = np.concatenate(vectors)
+    ids = [f"{place_id}#{c}" for c in range(copies) for place_id in ids]
+    queries = base[np.abs(base).sum(axis=1) > 0]
+
+    exact = VectorIndex(ids, vectors, vectors.shape[1])
+    start = time.perf_counter()
+    truth = [exact.search(query, k) for query in queries]
+    results = [{"index": "exact", "n_probe": None, "ms_per_query": (time.perf_counter() - start) * 1000 / len(queries), "recall": 1.0}]
+
+    ivf = IVFIndex.build(ids, vectors, vectors.shape[1], n_lists)
+    for n_probe in n_probes:
+        start = time.perf_counter()
+        found = [ivf.search(query, k, n_probe) for query in queries]
+        elapsed = (time.perf_counter() - start) * 1000 / len(queries)
+        hits = [len({i for i, _ in t} & {i for i, _ in f}) / k for t, f in zip(truth, found)]
+        results.append({"index": "ivf", "n_probe": n_probe, "ms_per_query": elapsed, "recall": sum(hits) / len(hits)})
+    return results
+
+
+if __name__ == "__main__":
+    # Usage: python ann_index.py <copies> <proc_data_file> [<proc_data_file> ...]
+    for row in benchmark(sys.argv[2:], copies=int(sys.argv[1])):
+        print(f"{row['index']:<6} n_probe={str(row['n_probe']):<5} {row['ms_per_query']:.3f} ms/query  recall@5 {row['recall']:.3f}")
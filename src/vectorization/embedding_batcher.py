@@ -0,0 +1,58 @@
+"""
+Collects texts to embed and sends them as multi-input embedding requests.
+"""
+import time
+import threading
+
+
+class EmbeddingBatcher:
+    """
+    Texts are submitted under a caller-chosen key, e.g. (place_id, "food").
+    A batch is sent when `batch_size` texts are pending or the oldest pending
+    text has waited `flush_interval` seconds. Results are passed to
+    `on_result` if given, otherwise they are collected in `results`.
+    """
+
+    def __init__(self, embed_many, batch_size = 32, flush_interval = 5.0, on_result = None):
+        self.embed_many = embed_many
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_result = on_result
+        self.results = {}
+        self.requests = 0
+        self._pending = []
+        self._oldest = None
+        self._lock = threading.Lock()
+
+    def submit(self, key, text):
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((key, text))
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+        else:
+            self.poll()
+
+    def poll(self):
+        """
+        Flush if the oldest pending text has waited longer than `flush_interval`.
+        """
+        with self._lock:
+            due = self._pending and time.monotonic() - self._oldest >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        embeddings = self.embed_many([text for _, text in batch])
+        self.requests += 1
+        for (key, _), embedding in zip(batch, embeddings):
+            if self.on_result is not None:
+                self.on_result(key, embedding)
+            else:
+                self.results[key] = embedding
@@ -0,0 +1,94 @@
+"""
+On-disk, content-addressed cache for text embeddings.
+
+Each entry is a raw little-endian float32 file named after the sha256 of
+model + text. The cache is bounded in bytes and evicts the least recently
+used entries first; access order survives restarts through file mtimes.
+It is safe to share between threads.
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+SUFFIX = ".f32"
+
+
+class EmbeddingCache:
+
+    def __init__(self, directory, max_bytes = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        # key -> size in bytes, least recently used first
+        self.entries = OrderedDict()
+        files = [entry for entry in os.scandir(directory) if entry.name.endswith(SUFFIX)]
+        for entry in sorted(files, key=lambda e: e.stat().st_mtime):
+            self.entries[entry.name[:-len(SUFFIX)]] = entry.stat().st_size
+        self.total_bytes = sum(self.entries.values())
+
+    @staticmethod
+    def key(model, text):
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, model, text):
+        """
+        Return the cached embedding as a list of floats, or None.
+        """
+        key = self.key(model, text)
+        with self._lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+        try:
+            embedding = np.fromfile(self._path(key), dtype="<f4")
+            os.utime(self._path(key))
+        except OSError:
+            # Removed behind our back, or evicted by another thread meanwhile
+            with self._lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+            self.hits += 1
+        return embedding.tolist()
+
+    def put(self, model, text, embedding):
+        key = self.key(model, text)
+        data = np.asarray(embedding, dtype="<f4").tobytes()
+        # Per-thread temporary name so concurrent writers of one key never share a file
+        tmp = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(key))
+
+        with self._lock:
+            self.total_bytes += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self.entries), "bytes": self.total_bytes}
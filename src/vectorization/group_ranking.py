@@ -0,0 +1,72 @@
+"""
+Consensus ranking of restaurants for a group of any size.
+
+Every member is scored against every candidate restaurant in one
+(members, restaurants) matrix of fused food + place scores, and the
+columns are folded into one group score by an aggregation:
+
+- mean:         average satisfaction, same ranking as the mean member vector
+- least_misery: a restaurant is only as good as its least happy member
+- borda:        each member ranks the candidates and gives n-1 points to
+                their favourite down to 0 for their least favourite
+"""
+import numpy as np
+
+from vector_index import top_k
+
+
+def mean(scores):
+    return scores.mean(axis=0)
+
+
+def least_misery(scores):
+    return scores.min(axis=0)
+
+
+def borda(scores):
+    ranks = np.argsort(np.argsort(scores, axis=1, kind="stable"), axis=1, kind="stable")
+    return ranks.sum(axis=0).astype(np.float32)
+
+
+# name -> function folding a (members, restaurants) matrix into (restaurants,)
+AGGREGATIONS = {
+    "mean": mean,
+    "least_misery": least_misery,
+    "borda": borda,
+}
+
+
+def member_scores(index, food_queries, place_queries, food_weight = 1.0, place_weight = 1.0, shortlist = 50):
+    """
+    Return (ids, scores): candidate restaurant ids and the (members, candidates)
+    fused score matrix. Exact indexes score every restaurant. Otherwise the
+    candidates are the union of each member's fused shortlist, and every
+    member is re-scored exactly against every candidate, including the ones
+    outside their own shortlist.
+    """
+    food_queries = np.asarray(food_queries, dtype=np.float32).reshape(-1, index.food.dim)
+    place_queries = np.asarray(place_queries, dtype=np.float32).reshape(-1, index.place.dim)
+
+    if index.exact_scan:
+        return index.food.ids, index.fused_scores(food_queries, place_queries, food_weight, place_weight)
+
+    hits = index.search_fused_batch(food_queries, place_queries, shortlist, food_weight, place_weight, shortlist)
+    ids = list(dict.fromkeys(item_id for member_hits in hits for item_id, _ in member_hits))
+    return ids, index.candidate_scores(food_queries, place_queries, ids, food_weight, place_weight)
+
+
+def rank_group(index, food_queries, place_queries, k = 10, aggregation = "mean",
+               food_weight = 1.0, place_weight = 1.0, shortlist = 50):
+    """
+    Top-k (restaurant_id, group score) pairs for members given as stacked
+    food and place query vectors, one row per member.
+    """
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation {aggregation}, expected one of {sorted(AGGREGATIONS)}")
+
+    ids, scores = member_scores(index, food_queries, place_queries, food_weight, place_weight, shortlist)
+    if len(ids) == 0 or scores.shape[0] == 0:
+        return []
+
+    group_scores = AGGREGATIONS[aggregation](scores)
+    return [(ids[i], float(group_scores[i])) for i in top_k(group_scores, k)]
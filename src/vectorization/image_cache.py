@@ -0,0 +1,90 @@
+"""
+Disk-backed cache of restaurant photos, downscaled and re-encoded as JPEG
+before they are uploaded to the vision model.
+"""
+import os
+import hashlib
+import threading
+from io import BytesIO
+from PIL import Image
+
+session = None
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size = 16):
+    """
+    Shared requests session so photo downloads reuse pooled connections.
+    """
+    global session
+    with _session_lock:
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+    return session
+
+
+def downscale_jpeg(data, max_side = 1024, quality = 85):
+    """
+    Shrink an encoded image so its longest side is at most `max_side`
+    and re-encode it as JPEG.
+    """
+    image = Image.open(BytesIO(data))
+    image.thumbnail((max_side, max_side))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    out = BytesIO()
+    image.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+
+class ImageCache:
+    """
+    Files are keyed by sha256 of the URL and the downscaling settings, so
+    changing the settings never serves stale sizes.
+    """
+
+    def __init__(self, directory, max_side = 1024, quality = 85):
+        self.directory = directory
+        self.max_side = max_side
+        self.quality = quality
+        self.hits = 0
+        self.misses = 0
+        self.bytes_downloaded = 0
+        self.bytes_cached = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url):
+        key = hashlib.sha256(f"{url}\0{self.max_side}\0{self.quality}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + ".jpg")
+
+    def fetch(self, url):
+        """
+        Return the downscaled JPEG bytes of `url`, downloading it only once.
+        """
+        path = self._path(url)
+        if os.path.exists(path):
+            self.hits += 1
+            with open(path, "rb") as f:
+                return f.read()
+
+        self.misses += 1
+        response = get_session().get(url, timeout=30)
+        response.raise_for_status()
+        self.bytes_downloaded += len(response.content)
+
+        data = downscale_jpeg(response.content, self.max_side, self.quality)
+        self.bytes_cached += len(data)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return data
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "bytes_downloaded": self.bytes_downloaded, "bytes_cached": self.bytes_cached}
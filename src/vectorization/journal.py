@@ -0,0 +1,86 @@
+"""
+Append-only journal of per-place embedding results, so an interrupted
+`create_embeddings_file` run can resume where it stopped.
+
+One JSON object per line; vectors are base64 encoded little-endian float32.
+A truncated last line (crash mid-write) is ignored on load.
+"""
+import os
+import json
+import base64
+import threading
+import numpy as np
+
+
+def encode_vector(vector):
+    if vector is None:
+        return None
+    return base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode("ascii")
+
+
+def decode_vector(data):
+    if data is None:
+        return None
+    return np.frombuffer(base64.b64decode(data), dtype="<f4")
+
+
+class PlaceJournal:
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def iter_entries(self):
+        """
+        Stream (place_id, entry) for every complete line in file order, so a
+        later entry for a place supersedes an earlier one. Entries hold
+        foodText, restaurantText, foodVector and restaurantVector.
+        """
+        if not os.path.exists(self.path):
+            return
+        complete = 0
+        partial = False
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    partial = True
+                    break
+                complete += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                yield record["id"], {
+                    "foodText": record["foodText"],
+                    "restaurantText": record["restaurantText"],
+                    "foodVector": decode_vector(record["foodVector"]),
+                    "restaurantVector": decode_vector(record["restaurantVector"]),
+                }
+        if partial:
+            # Drop the partial line so the next append starts on a fresh line
+            with open(self.path, "r+b") as f:
+                f.truncate(complete)
+
+    def load(self):
+        """
+        Return {place_id: entry} for every complete line, later lines winning.
+        """
+        return dict(self.iter_entries())
+
+    def append(self, place_id, food_text, restaurant_text, food_vector, restaurant_vector):
+        line = json.dumps({
+            "id": place_id,
+            "foodText": food_text,
+            "restaurantText": restaurant_text,
+            "foodVector": encode_vector(food_vector),
+            "restaurantVector": encode_vector(restaurant_vector),
+        })
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
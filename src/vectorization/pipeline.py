@@ -0,0 +1,164 @@
+"""
+Small threaded pipeline helpers for the ingestion scripts: token-bucket
+rate limits, exponential backoff with jitter and bounded-queue stages.
+"""
+import time
+import queue
+import random
+import threading
+
+_DONE = object()
+
+
+class TokenBucket:
+    """
+    Allows `rate` calls per second on average with bursts of up to `capacity`.
+    `acquire` blocks until a token is available. Thread safe.
+    """
+
+    def __init__(self, rate, capacity = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# HTTP statuses a retry can fix: request timeout, rate limit and server errors
+TRANSIENT_STATUS = {408, 429}
+
+
+def is_transient(error):
+    """
+    True for failures worth retrying: rate limits, 5xx responses, timeouts and
+    dropped connections. The status is read from the SDK error (`status_code`
+    on OpenAI-compatible clients, `code` on google-genai); bad requests, bad
+    input and bad credentials are permanent.
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int):
+        return status in TRANSIENT_STATUS or status >= 500
+    # Connection and timeout errors of the HTTP clients carry no status
+    name = type(error).__name__
+    return "Timeout" in name or "Connect" in name
+
+
+def call_with_backoff(fn, limiter = None, retries = 8, base_delay = 1.0, max_delay = 64.0, retry_if = is_transient):
+    """
+    Call `fn()`, retrying transient failures with exponential backoff and full
+    jitter. Every attempt first takes a token from `limiter` if one is given.
+    Failures `retry_if` rejects, and the last failure, are re-raised.
+    """
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries or not retry_if(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            print(f"{type(e).__name__}: {e} - retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+class StageStats:
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.started = time.monotonic()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def record(self, elapsed, error = False):
+        with self._lock:
+            self.items += 1
+            self.errors += int(error)
+            self.busy += elapsed
+
+    def throughput(self):
+        """
+        Items per second of wall time the stage was running.
+        """
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return self.items / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.name}: {self.items} items, {self.errors} errors, {self.throughput():.2f} items/s, busy {self.busy:.1f}s"
+
+
+class Stage:
+    """
+    `fn(item)` runs on `workers` threads reading from a queue of at most
+    `queue_size` items; a return value of None drops the item.
+    """
+
+    def __init__(self, name, fn, workers = 1, queue_size = 16):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue_size = queue_size
+        self.stats = StageStats(name)
+
+
+def run_pipeline(items, stages):
+    """
+    Push `items` through `stages` in order and wait for every stage to drain.
+    Returns the StageStats of each stage.
+    """
+    queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages] + [None]
+
+    def work(stage, inbox, outbox):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                return
+            start = time.monotonic()
+            try:
+                result = stage.fn(item)
+            except Exception as e:
+                print(f"{stage.name} failed on {item!r}: {e}")
+                stage.stats.record(time.monotonic() - start, error=True)
+                continue
+            stage.stats.record(time.monotonic() - start)
+            if result is not None and outbox is not None:
+                outbox.put(result)
+
+    threads = []
+    for i, stage in enumerate(stages):
+        stage.stats.started = time.monotonic()
+        stage_threads = [threading.Thread(target=work, args=(stage, queues[i], queues[i + 1]), daemon=True)
+                         for _ in range(stage.workers)]
+        for thread in stage_threads:
+            thread.start()
+        threads.append(stage_threads)
+
+    for item in items:
+        queues[0].put(item)
+
+    # Drain stage by stage: once a stage's workers exit, nothing more reaches the next one
+    for i, stage in enumerate(stages):
+        for _ in threads[i]:
+            queues[i].put(_DONE)
+        for thread in threads[i]:
+            thread.join()
+        stage.stats.finished = time.monotonic()
+
+    return [stage.stats for stage in stages]
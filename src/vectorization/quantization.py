@@ -0,0 +1,184 @@
+"""
+Quantized restaurant vectors for a cheap first scoring pass.
+
+Candidates are scored against int8 (per-vector scale) or float16 copies of
+the vectors, and the best `shortlist` of them are re-ranked with the full
+precision vectors.
+"""
+import sys
+import numpy as np
+
+from vector_index import top_k
+import vector_store as vstore
+
+# Rows scored per block, bounds the float32 temporary used for scoring
+BLOCK_ROWS = 2048
+
+
+def quantize_int8(matrix):
+    """
+    Symmetric int8 quantization with one scale per vector.
+    Returns (codes, scales) with matrix ~= codes * scales[:, None].
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_float16(matrix):
+    return np.asarray(matrix, dtype=np.float16)
+
+
+class QuantizedIndex:
+    """
+    Two-stage dot-product index: quantized candidate pass, exact re-rank.
+    `exact` may be any (n, dim) array, e.g. a memory-mapped VectorStore matrix,
+    and is only touched for the shortlisted rows. It is never copied: added
+    vectors are kept in a small in-memory tail and removals only drop rows
+    from the position -> row mapping, so a memory-mapped `exact` stays on disk.
+    """
+
+    def __init__(self, ids, vectors, mode = "int8", exact = None):
+        self.ids = list(ids)
+        self.mode = mode
+        self.exact = vectors if exact is None else exact
+        self._added = np.zeros((0, np.shape(vectors)[1]), dtype=np.float32)
+        # Position in `ids` -> row of `exact`, or len(exact) + row of `_added`
+        self._rows = np.arange(len(self.ids))
+        if mode == "int8":
+            self.codes, self.scales = quantize_int8(vectors)
+        elif mode == "float16":
+            self.codes, self.scales = quantize_float16(vectors), None
+        else:
+            raise ValueError(f"Unknown quantization mode {mode}")
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        return self.codes.shape[1]
+
+    def add(self, item_id, vector):
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        self.ids.append(item_id)
+        self._rows = np.append(self._rows, len(self.exact) + len(self._added))
+        self._added = np.vstack([self._added, vector])
+        if self.mode == "int8":
+            codes, scales = quantize_int8(vector)
+            self.codes = np.vstack([self.codes, codes])
+            self.scales = np.concatenate([self.scales, scales])
+        else:
+            self.codes = np.vstack([self.codes, quantize_float16(vector)])
+
+    def remove(self, item_ids):
+        item_ids = set(item_ids)
+        keep = [i for i, item_id in enumerate(self.ids) if item_id not in item_ids]
+        self.ids = [self.ids[i] for i in keep]
+        self._rows = self._rows[keep]
+        self.codes = self.codes[keep]
+        if self.scales is not None:
+            self.scales = self.scales[keep]
+
+    @property
+    def nbytes(self):
+        """Resident size of the quantized codes; see `exact_nbytes` for the re-ranking vectors"""
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @property
+    def exact_nbytes(self):
+        """Resident size of the full precision vectors, 0 when they are memory-mapped"""
+        on_disk = isinstance(self.exact, np.memmap) or isinstance(getattr(self.exact, "base", None), np.memmap)
+        return (0 if on_disk else np.asarray(self.exact).nbytes) + self._added.nbytes
+
+    def exact_vectors(self, positions):
+        """
+        Full precision float32 vectors at the given positions of `ids`.
+        """
+        rows = self._rows[positions]
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        stored = rows < len(self.exact)
+        out[stored] = self.exact[rows[stored]]
+        out[~stored] = self._added[rows[~stored] - len(self.exact)]
+        return out
+
+    def approximate_scores(self, queries):
+        """
+        Scores of (q, dim) queries against every quantized vector, shape (q, n).
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        scores = np.empty((queries.shape[0], len(self.ids)), dtype=np.float32)
+        for start in range(0, len(self.ids), BLOCK_ROWS):
+            block = self.codes[start:start + BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + BLOCK_ROWS] = queries @ block.T
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    def search_batch(self, queries, k = 5, shortlist = 50, rerank = True):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.codes.shape[1])
+        candidates = top_k(self.approximate_scores(queries), max(k, shortlist) if rerank else k)
+
+        results = []
+        for query, candidate in zip(queries, candidates):
+            if rerank:
+                order = np.sort(candidate)
+                exact = self.exact_vectors(order) @ query
+                best = top_k(exact, k)
+                results.append([(self.ids[order[i]], float(exact[i])) for i in best])
+            else:
+                results.append([(self.ids[i], None) for i in candidate])
+        return results
+
+    def search(self, query, k = 5, shortlist = 50, rerank = True):
+        return self.search_batch(query, k, shortlist, rerank)[0]
+
+
+def recall_at_k(exact, approximate):
+    """
+    Mean fraction of the exact top-k ids found by the approximate search.
+    """
+    hits = [len({i for i, _ in e} & {i for i, _ in a}) / max(len(e), 1) for e, a in zip(exact, approximate)]
+    return sum(hits) / max(len(hits), 1)
+
+
+def recall_report(paths, k = 5, shortlist = 20):
+    """
+    Compare quantized search against exact search on the vectors of the given
+    `proc_data_<city>` files, using every stored vector as a query.
+    """
+    ids, food, place = [], [], []
+    for path in paths:
+        city_ids, city_food, city_place = vstore.read_city_vectors(path)
+        ids += city_ids
+        food.append(city_food)
+        place.append(city_place)
+
+    report = []
+    for kind, matrix in (("food", np.concatenate(food)), ("place", np.concatenate(place))):
+        queries = matrix[np.abs(matrix).sum(axis=1) > 0]
+        scores = queries @ matrix.T
+        exact = [[(ids[i], None) for i in row] for row in top_k(scores, k)]
+
+        for mode in ("int8", "float16"):
+            index = QuantizedIndex(ids, matrix, mode)
+            report.append({
+                "vectors": kind,
+                "mode": mode,
+                # Codes alone, and codes plus the full precision vectors kept for re-ranking
+                "memory_ratio": matrix.nbytes / index.nbytes,
+                "resident_ratio": matrix.nbytes / (index.nbytes + index.exact_nbytes),
+                "recall_first_pass": recall_at_k(exact, index.search_batch(queries, k, rerank=False)),
+                "recall_reranked": recall_at_k(exact, index.search_batch(queries, k, shortlist)),
+            })
+    return report
+
+
+if __name__ == "__main__":
+    # Usage: python quantization.py <proc_data_file> [<proc_data_file> ...]
+    for row in recall_report(sys.argv[1:]):
+        print(f"{row['vectors']:<6} {row['mode']:<8} memory x{row['memory_ratio']:.1f} "
+              f"(x{row['resident_ratio']:.1f} with exact vectors)  "
+              f"recall@5 first pass {row['recall_first_pass']:.3f}  reranked {row['recall_reranked']:.3f}")
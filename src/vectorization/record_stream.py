@@ -0,0 +1,134 @@
+"""
+Streaming access to `proc_data_<city>` style files: {place_id: record, ...}.
+
+Newline-delimited files (`<path>.ndjson`, one {"id": ..., "record": ...}
+per line) are preferred. The legacy single-object JSON files are decoded
+incrementally, one record at a time, so neither format is ever loaded whole.
+"""
+import os
+import sys
+import json
+
+CHUNK_SIZE = 64 * 1024
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+def ndjson_path(path):
+    return path + ".ndjson"
+
+
+class RecordWriter:
+    """
+    Appends (place_id, record) pairs to a newline-delimited file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "w")
+
+    def write(self, place_id, record):
+        self._file.write(json.dumps({"id": place_id, "record": record}) + "\n")
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _iter_ndjson(path):
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry["id"], entry["record"]
+
+
+def _iter_json_object(path):
+    """
+    Incrementally decode a top-level JSON object, yielding one (key, value)
+    at a time while holding only the current record in memory.
+    """
+    with open(path, "r") as f:
+        buffer = ""
+        eof = False
+
+        def fill():
+            nonlocal buffer, eof
+            chunk = f.read(max(CHUNK_SIZE, len(buffer)))
+            eof = chunk == ""
+            buffer += chunk
+
+        def skip_whitespace():
+            nonlocal buffer
+            while True:
+                buffer = buffer.lstrip(_WHITESPACE)
+                if buffer or eof:
+                    return
+                fill()
+
+        def decode():
+            # A value is complete once something other than whitespace follows it
+            nonlocal buffer
+            while True:
+                try:
+                    value, end = _decoder.raw_decode(buffer)
+                    if buffer[end:].strip(_WHITESPACE) or eof:
+                        buffer = buffer[end:]
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        def expect(char):
+            nonlocal buffer
+            skip_whitespace()
+            if not buffer.startswith(char):
+                raise ValueError(f"Expected {char!r} in {path}")
+            buffer = buffer[1:]
+
+        expect("{")
+        skip_whitespace()
+        if buffer.startswith("}"):
+            return
+        while True:
+            skip_whitespace()
+            key = decode()
+            expect(":")
+            skip_whitespace()
+            yield key, decode()
+            skip_whitespace()
+            if buffer.startswith("}"):
+                return
+            expect(",")
+
+
+def iter_records(path):
+    """
+    Yield (place_id, record) pairs of a `proc_data_<city>` file, from its
+    `.ndjson` version if it exists.
+    """
+    if os.path.exists(ndjson_path(path)):
+        return _iter_ndjson(ndjson_path(path))
+    return _iter_json_object(path)
+
+
+def convert_to_ndjson(path):
+    """
+    Write the newline-delimited version of a single-object JSON file.
+    """
+    with RecordWriter(ndjson_path(path)) as writer:
+        for place_id, record in _iter_json_object(path):
+            writer.write(place_id, record)
+
+
+if __name__ == "__main__":
+    # Usage: python record_stream.py <proc_data_file> [<proc_data_file> ...]
+    for path in sys.argv[1:]:
+        convert_to_ndjson(path)
+        print(f"Wrote {ndjson_path(path)}")
@@ -0,0 +1,101 @@
+"""
+Precomputed embeddings for the finite preference vocabulary of the app.
+
+`build_tag_table` runs once offline: every tag is described by Gemini and
+embedded, and the vectors are stored in a binary vector store (food tags in
+the food matrix, place tags in the place matrix). At request time user
+vectors are composed locally as the mean of their tag vectors.
+"""
+import os
+import sys
+import json
+
+import vectorization as vect
+import vector_store as vstore
+
+# Keep in sync with the options in bitefinder/app/(auth)/register.tsx
+PLACE_TAGS = [
+    # ambiance
+    "Rustic", "Modern", "Futuristic", "Minimalistic", "Nature", "Indoor", "Outdoor",
+    # color
+    "Warm", "Cool", "Neutral", "Vibrant", "Dark", "Light", "Colorful",
+    # price
+    "Budget-friendly", "Mid-Range", "Upscale",
+    # crowd
+    "Quiet", "Lively",
+    # cuisine
+    "Traditional", "Gourmet", "Cousy", "Exotic", "Fusion", "Street Food", "Fast Food", "Healthy", "Vegetarian", "Vegan",
+]
+
+FOOD_TAGS = [
+    # flavor
+    "Sweet", "Savory", "Spicy", "Sour", "Umami", "Bitter", "Smoky", "Tangy", "Herbal",
+    # texture
+    "Crispy", "Creamy", "Crunchy", "Tender", "Juicy", "Chewy", "Flaky", "Silky", "Soft",
+    # presentation
+    "Plated", "Buffet", "Bento", "Bowl", "Tasting Menu", "Handheld",
+    # meal
+    "Breakfast", "Brunch", "Lunch", "Dinner", "Late Night", "Snacks", "Dessert",
+    # ingredient
+    "Organic", "Local", "Seasonal", "Farm-to-Table", "Foraged", "Sustainable", "Seafood-Based", "Plant-Based",
+]
+
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tag_table")
+
+
+def build_tag_table(path = DEFAULT_TABLE_PATH):
+    """
+    Describe and embed every tag once, writing `path`_vec.bin and `path`_text.
+    """
+    vect.starting_gemini_client()
+    vect.starting_mistral_client()
+
+    texts = {}
+    with vstore.VectorStoreWriter(vstore.store_path(path), PLACE_TAGS + FOOD_TAGS) as writer:
+        for tag in PLACE_TAGS:
+            text = vect.text_from_user_restaurant_preferences(str([tag]))
+            writer.write(tag, None, vect.creating_embeddings_from_text(text))
+            texts[tag] = text
+        for tag in FOOD_TAGS:
+            text = vect.text_from_user_food_preferences(str([tag]))
+            writer.write(tag, vect.creating_embeddings_from_text(text), None)
+            texts[tag] = text
+
+    with open(vstore.text_path(path), "w") as f:
+        f.write(json.dumps(texts))
+
+
+def load_tag_table(path = DEFAULT_TABLE_PATH):
+    """
+    Open the tag table, or return None if it has not been built.
+    """
+    if not os.path.exists(vstore.store_path(path)):
+        return None
+    return vstore.open_vector_store(vstore.store_path(path))
+
+
+def compose_preference_vector(table, preferences, food = 0, weights = None):
+    """
+    Weighted mean of the tag vectors of `preferences`.
+    Returns None when the table is missing or a tag has no vector, so callers
+    can fall back to `create_embeddings_from_preferences`.
+    """
+    if table is None or len(preferences) == 0:
+        return None
+
+    vectors = []
+    for tag in preferences:
+        if tag not in table:
+            return None
+        food_vector, place_vector = table.get(tag)
+        vector = food_vector if food == 1 else place_vector
+        if vector is None:
+            return None
+        vectors.append(vector)
+
+    return vect.average_embedding(vectors, weights)
+
+
+if __name__ == "__main__":
+    # Usage: python tag_embeddings.py [table_path]
+    build_tag_table(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TABLE_PATH)
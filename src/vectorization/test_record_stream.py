@@ -0,0 +1,60 @@
+"""
+The incremental JSON object decoder against json.load, on the committed
+scrapes and on a few edge cases, with chunks small enough to split every token.
+"""
+import os
+import json
+import glob
+
+import pytest
+
+import record_stream as rs
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "webscrapping")
+PROC_DATA = sorted(glob.glob(os.path.join(DATA_DIR, "proc_data_*")))
+
+
+@pytest.fixture(autouse=True)
+def tiny_chunks(monkeypatch):
+    monkeypatch.setattr(rs, "CHUNK_SIZE", 7)
+
+
+@pytest.mark.parametrize("path", PROC_DATA, ids=os.path.basename)
+def test_iter_records_matches_json_load(path):
+    with open(path, "r") as f:
+        expected = json.load(f)
+    assert list(rs.iter_records(path)) == list(expected.items())
+
+
+@pytest.mark.parametrize("text", [
+    "{}",
+    " \n{ }\n",
+    '{"a": 1}',
+    '{"a":1,"b":[1, 2, {"c": "}"}],"d":null}\n',
+    '{ "x" : "a \\" quoted , } string" , "y" : -1.5e3 , "z" : true }',
+])
+def test_edge_cases(tmp_path, text):
+    path = str(tmp_path / "proc_data_test")
+    with open(path, "w") as f:
+        f.write(text)
+    assert list(rs.iter_records(path)) == list(json.loads(text).items())
+
+
+def test_truncated_file_raises(tmp_path):
+    path = str(tmp_path / "proc_data_test")
+    with open(path, "w") as f:
+        f.write('{"a": {"b": [1, 2')
+    with pytest.raises(ValueError):
+        list(rs.iter_records(path))
+
+
+def test_ndjson_is_preferred_and_equal(tmp_path):
+    path = str(tmp_path / "proc_data_test")
+    records = {"p1": {"photos": ["u1"]}, "p2": {"photos": []}}
+    with open(path, "w") as f:
+        json.dump(records, f)
+    rs.convert_to_ndjson(path)
+    # Only the .ndjson copy is read once it exists
+    with open(path, "w") as f:
+        f.write("not json")
+    assert list(rs.iter_records(path)) == list(records.items())
@@ -0,0 +1,91 @@
+"""
+convert_json_vec -> VectorStore round trips, including missing vectors.
+"""
+import json
+
+import numpy as np
+import pytest
+
+import vector_store as vstore
+
+DIM = 8
+
+
+def write_json_vec(tmp_path, entries):
+    path = str(tmp_path / "proc_data_test")
+    with open(path + "_vec", "w") as f:
+        json.dump(entries, f)
+    return path
+
+
+@pytest.fixture
+def entries():
+    rng = np.random.default_rng(0)
+    vector = lambda: rng.normal(size=DIM).astype(np.float32).tolist()
+    return {
+        "both": {"foodText": "pizza", "restaurantText": "terrace", "foodVector": vector(), "restaurantVector": vector()},
+        "food_only": {"foodText": "sushi", "restaurantText": "", "foodVector": vector(), "restaurantVector": None},
+        "place_only": {"foodText": "", "restaurantText": "bar", "foodVector": None, "restaurantVector": vector()},
+        "neither": {"foodText": "", "restaurantText": "", "foodVector": None, "restaurantVector": None},
+        "ünïcode/id": {"foodText": "", "restaurantText": "", "foodVector": vector(), "restaurantVector": None},
+    }
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("float32", 0), ("float16", 1e-2)])
+def test_round_trip(tmp_path, entries, dtype, tolerance):
+    path = write_json_vec(tmp_path, entries)
+    vstore.convert_json_vec(path, dtype, DIM)
+    store = vstore.open_vector_store(vstore.store_path(path))
+
+    assert store.ids == list(entries)
+    assert store.dim == DIM and store.dtype == np.dtype(dtype)
+    for place_id, entry in entries.items():
+        assert place_id in store
+        food, place = store.get(place_id)
+        for stored, expected in ((food, entry["foodVector"]), (place, entry["restaurantVector"])):
+            if expected is None:
+                assert stored is None
+            else:
+                np.testing.assert_allclose(stored, expected, atol=tolerance)
+
+    with open(vstore.text_path(path)) as f:
+        assert json.load(f)["food_only"] == {"foodText": "sushi", "restaurantText": ""}
+
+
+def test_matrices_are_aligned_views(tmp_path, entries):
+    path = write_json_vec(tmp_path, entries)
+    vstore.convert_json_vec(path, "float32", DIM)
+    store = vstore.open_vector_store(vstore.store_path(path))
+
+    for matrix in (store.food, store.place):
+        assert matrix.shape == (len(entries), DIM)
+        assert matrix.ctypes.data % vstore.ALIGNMENT == 0
+        assert isinstance(matrix, np.memmap)
+    assert store.mask.tolist() == [[1, 1], [1, 0], [0, 1], [0, 0], [1, 0]]
+
+
+def test_read_city_vectors_zero_fills_missing(tmp_path, entries):
+    path = write_json_vec(tmp_path, entries)
+    legacy = vstore.read_city_vectors(path, DIM)
+    vstore.convert_json_vec(path, "float32", DIM)
+    binary = vstore.read_city_vectors(path, DIM)
+
+    assert legacy[0] == binary[0] == list(entries)
+    np.testing.assert_array_equal(legacy[1], binary[1])
+    np.testing.assert_array_equal(legacy[2], binary[2])
+    # food_only has no place vector, place_only no food vector
+    assert not binary[2][1].any() and not binary[1][2].any()
+
+
+def test_empty_store(tmp_path):
+    path = write_json_vec(tmp_path, {})
+    vstore.convert_json_vec(path, "float32", DIM)
+    store = vstore.open_vector_store(vstore.store_path(path))
+    assert len(store) == 0 and list(store) == []
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not_a_store.bin"
+    path.write_bytes(b"\0" * 128)
+    with pytest.raises(ValueError):
+        vstore.open_vector_store(str(path))
@@ -0,0 +1,295 @@
+import json
+import tempfile
+import numpy as np
+
+VECTOR_DIM = 4096
+
+
+def parse_vector(value, dim = VECTOR_DIM):
+    """
+    Convert a vector as returned by the database (JSON text, bytes or None)
+    into a float32 array. Missing vectors become zero vectors.
+    """
+    if value is None:
+        return np.zeros(dim, dtype=np.float32)
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode("utf-8")
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def top_k(scores, k):
+    """
+    Return the indices of the k highest scores, best first.
+    Works on a 1-d array or row-wise on a 2-d array.
+    """
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+    if k < n:
+        part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        part = np.broadcast_to(np.arange(n), scores.shape).copy()
+    part_scores = np.take_along_axis(scores, part, axis=-1)
+    order = np.argsort(-part_scores, axis=-1, kind="stable")
+    return np.take_along_axis(part, order, axis=-1)
+
+
+class VectorIndex:
+    """
+    Exact dot-product index over a contiguous float32 matrix.
+    Scores match SingleStore's `<*>` operator.
+    """
+
+    def __init__(self, ids, vectors, dim = VECTOR_DIM):
+        self.ids = list(ids)
+        self.dim = dim
+        if len(self.ids) == 0:
+            self.matrix = np.zeros((0, dim), dtype=np.float32)
+        else:
+            # Strided views (e.g. half of a fused restaurant matrix) are kept without copying
+            self.matrix = np.asarray(vectors, dtype=np.float32).reshape(len(self.ids), dim)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, item_id, vector):
+        self.ids.append(item_id)
+        self.matrix = np.vstack([self.matrix, np.asarray(vector, dtype=np.float32).reshape(1, self.dim)])
+
+    def remove(self, item_ids):
+        item_ids = set(item_ids)
+        keep = [i for i, item_id in enumerate(self.ids) if item_id not in item_ids]
+        self.ids = [self.ids[i] for i in keep]
+        self.matrix = self.matrix[keep]
+
+    def scores(self, query):
+        return self.matrix @ np.asarray(query, dtype=np.float32)
+
+    def search(self, query, k = 5):
+        """
+        Return the k best (id, score) pairs for a single query vector.
+        """
+        scores = self.scores(query)
+        return [(self.ids[i], float(scores[i])) for i in top_k(scores, k)]
+
+    def search_batch(self, queries, k = 5):
+        """
+        Return one list of (id, score) pairs per query, scoring all queries
+        with a single matrix-matrix product.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        scores = queries @ self.matrix.T
+        top = top_k(scores, k)
+        return [[(self.ids[i], float(row[i])) for i in idx] for row, idx in zip(scores, top)]
+
+
+class RestaurantIndex:
+    """
+    Food and place vectors of every restaurant, loaded once and searched in process.
+
+    In the exact mode both live side by side in one (n, 2 * dim) matrix and
+    `food` / `place` are views of its halves, so a fused food + place query
+    is a single matrix product.
+    """
+
+    def __init__(self, ids, food_vectors, place_vectors, dim = VECTOR_DIM, quantization = None, fused = True):
+        self.ids = list(ids)
+        self.matrix = None
+        if quantization:
+            # int8 / float16 candidate pass with exact re-ranking
+            from quantization import QuantizedIndex
+            self.food = QuantizedIndex(self.ids, food_vectors, quantization)
+            self.place = QuantizedIndex(self.ids, place_vectors, quantization)
+        elif fused:
+            food = np.asarray(food_vectors, dtype=np.float32).reshape(len(self.ids), dim)
+            place = np.asarray(place_vectors, dtype=np.float32).reshape(len(self.ids), dim)
+            self._set_matrix(np.hstack([food, place]))
+        else:
+            self.food = VectorIndex(self.ids, food_vectors, dim)
+            self.place = VectorIndex(self.ids, place_vectors, dim)
+
+    @classmethod
+    def from_matrix(cls, ids, matrix):
+        """
+        Wrap an (n, 2 * dim) matrix of [food | place] rows without copying it.
+        """
+        index = cls.__new__(cls)
+        index.ids = list(ids)
+        index._set_matrix(matrix)
+        return index
+
+    @classmethod
+    def from_parts(cls, ids, food, place):
+        """
+        Wrap already built food and place indexes (exact, quantized or ANN).
+        """
+        index = cls.__new__(cls)
+        index.ids = list(ids)
+        index.matrix = None
+        index.food = food
+        index.place = place
+        return index
+
+    def _set_matrix(self, matrix):
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        dim = self.matrix.shape[1] // 2
+        self.food = VectorIndex(self.ids, self.matrix[:, :dim], dim)
+        self.place = VectorIndex(self.ids, self.matrix[:, dim:], dim)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, restaurant_id, food_vector, place_vector):
+        """
+        Insert one restaurant; missing vectors are stored as zero vectors.
+        """
+        food_vector = parse_vector(food_vector, self.food.dim)
+        place_vector = parse_vector(place_vector, self.place.dim)
+        self.ids.append(restaurant_id)
+        if self.matrix is not None:
+            self._set_matrix(np.vstack([self.matrix, np.concatenate([food_vector, place_vector])[None]]))
+        else:
+            self.food.add(restaurant_id, food_vector)
+            self.place.add(restaurant_id, place_vector)
+
+    def remove(self, restaurant_ids):
+        """
+        Drop restaurants, e.g. before re-adding the ones whose vectors changed.
+        """
+        restaurant_ids = set(restaurant_ids)
+        if self.matrix is not None:
+            keep = [i for i, restaurant_id in enumerate(self.ids) if restaurant_id not in restaurant_ids]
+            self.ids = [self.ids[i] for i in keep]
+            self._set_matrix(self.matrix[keep])
+            return
+        self.ids = [i for i in self.ids if i not in restaurant_ids]
+        self.food.remove(restaurant_ids)
+        self.place.remove(restaurant_ids)
+
+    def positions(self):
+        """
+        {restaurant_id: row} of the rows `fused_scores` addresses.
+        """
+        return {item_id: i for i, item_id in enumerate(self.food.ids)}
+
+    @property
+    def exact_scan(self):
+        """
+        True when every restaurant can be scored at full precision in one pass.
+        """
+        return self.matrix is not None or (isinstance(self.food, VectorIndex) and isinstance(self.place, VectorIndex))
+
+    def fused_scores(self, food_queries, place_queries, food_weight = 1.0, place_weight = 1.0, rows = None):
+        """
+        (queries, restaurants) matrix of `food_weight * food + place_weight * place`
+        scores, restricted to the restaurant positions in `rows` if given.
+        ANN parts have no row order; score their candidates with `candidate_scores`.
+        """
+        food_queries = np.asarray(food_queries, dtype=np.float32).reshape(-1, self.food.dim)
+        place_queries = np.asarray(place_queries, dtype=np.float32).reshape(-1, self.place.dim)
+
+        if self.matrix is not None:
+            matrix = self.matrix if rows is None else self.matrix[rows]
+            return np.hstack([food_weight * food_queries, place_weight * place_queries]) @ matrix.T
+
+        if isinstance(self.food, VectorIndex) and isinstance(self.place, VectorIndex):
+            food, place = self.food.matrix, self.place.matrix
+            if rows is not None:
+                food, place = food[rows], place[rows]
+        elif hasattr(self.food, "exact_vectors") and hasattr(self.place, "exact_vectors"):
+            rows = np.arange(len(self.ids)) if rows is None else rows
+            food, place = self.food.exact_vectors(rows), self.place.exact_vectors(rows)
+        else:
+            raise ValueError("ANN parts are scored by id, use candidate_scores")
+        return food_weight * (food_queries @ food.T) + place_weight * (place_queries @ place.T)
+
+    def candidate_scores(self, food_queries, place_queries, item_ids, food_weight = 1.0, place_weight = 1.0,
+                         positions = None):
+        """
+        (queries, len(item_ids)) matrix of exact fused scores of the given
+        restaurants. ANN parts look the stored vectors up by id; the other
+        modes go through `fused_scores` with the rows in `positions`.
+        """
+        if hasattr(self.food, "vectors") and hasattr(self.place, "vectors"):
+            food_queries = np.asarray(food_queries, dtype=np.float32).reshape(-1, self.food.dim)
+            place_queries = np.asarray(place_queries, dtype=np.float32).reshape(-1, self.place.dim)
+            food, place = self.food.vectors(item_ids), self.place.vectors(item_ids)
+            return food_weight * (food_queries @ food.T) + place_weight * (place_queries @ place.T)
+        positions = self.positions() if positions is None else positions
+        return self.fused_scores(food_queries, place_queries, food_weight, place_weight,
+                                 [positions[item_id] for item_id in item_ids])
+
+    def search_fused_batch(self, food_queries, place_queries, k = 10, food_weight = 1.0, place_weight = 1.0,
+                           shortlist = 50):
+        """
+        Top-k restaurants by `food_weight * food + place_weight * place`, one
+        deduplicated list of (id, score) pairs per pair of queries.
+
+        Exact indexes score every restaurant in one pass. Quantized and ANN
+        parts have no full score matrix, so the union of their shortlists is
+        re-scored exactly instead, against both the food and the place vector
+        of every candidate.
+        """
+        food_queries = np.asarray(food_queries, dtype=np.float32).reshape(-1, self.food.dim)
+        place_queries = np.asarray(place_queries, dtype=np.float32).reshape(-1, self.place.dim)
+
+        if self.exact_scan:
+            scores = self.fused_scores(food_queries, place_queries, food_weight, place_weight)
+            top = top_k(scores, k)
+            return [[(self.food.ids[i], float(row[i])) for i in idx] for row, idx in zip(scores, top)]
+
+        results = []
+        food_top = self.food.search_batch(food_queries, max(k, shortlist))
+        place_top = self.place.search_batch(place_queries, max(k, shortlist))
+        positions = None if hasattr(self.food, "vectors") else self.positions()
+        for q, (food_hits, place_hits) in enumerate(zip(food_top, place_top)):
+            candidates = list(dict.fromkeys(item_id for item_id, _ in food_hits + place_hits))
+            scores = self.candidate_scores(food_queries[q], place_queries[q], candidates, food_weight, place_weight,
+                                           positions)
+            fused = dict(zip(candidates, scores[0].tolist()))
+            results.append(sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k])
+        return results
+
+    def search_fused(self, food_query, place_query, k = 10, food_weight = 1.0, place_weight = 1.0):
+        return self.search_fused_batch(food_query, place_query, k, food_weight, place_weight)[0]
+
+
+def load_restaurant_index(conn, dim = VECTOR_DIM, quantization = None):
+    """
+    Build a RestaurantIndex from the restaurant table.
+    `quantization` ("int8" or "float16") enables the quantized scoring mode;
+    the full precision vectors used for re-ranking are then spilled to a
+    memory-mapped temporary file, so only the quantized codes stay resident.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT restaurant_id, food_vector, place_vector FROM restaurant")
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    ids = [row[0] for row in rows]
+    # [food | place] rows, filled in place so the fused matrix is never copied
+    if quantization and rows:
+        matrix = np.memmap(tempfile.TemporaryFile(), dtype=np.float32, mode="w+", shape=(len(rows), 2 * dim))
+    else:
+        matrix = np.empty((len(rows), 2 * dim), dtype=np.float32)
+    for i, (_, food_vector, place_vector) in enumerate(rows):
+        matrix[i, :dim] = parse_vector(food_vector, dim)
+        matrix[i, dim:] = parse_vector(place_vector, dim)
+
+    if quantization:
+        return RestaurantIndex(ids, matrix[:, :dim], matrix[:, dim:], dim, quantization)
+    return RestaurantIndex.from_matrix(ids, matrix)
+
+
+def load_restaurant_index_from_store(store, quantization = None):
+    """
+    Build a RestaurantIndex straight from a memory-mapped VectorStore.
+    float32 stores are used without copying, so food and place stay separate
+    matrices and fused queries take one product per matrix; missing vectors are zero rows.
+    """
+    return RestaurantIndex(store.ids, store.food, store.place, store.dim, quantization, fused=False)
@@ -0,0 +1,196 @@
+"""
+Binary store for restaurant food/place vectors.
+
+Layout (little endian):
+    header   magic "BFVS", version, dtype code, count, dim, id table size
+    ids      utf-8 place ids separated by "\\n"
+    mask     uint8 (count, 2) -> 1 if the food / place vector is present
+    food     (count, dim) matrix of float32 or float16
+    place    (count, dim) matrix of float32 or float16
+
+Every section starts on a 64 byte boundary so the matrices can be opened
+with numpy.memmap without copying.
+"""
+import os
+import sys
+import json
+import struct
+import numpy as np
+
+MAGIC = b"BFVS"
+VERSION = 1
+ALIGNMENT = 64
+HEADER = struct.Struct("<4sHBxIII")
+DTYPES = {0: np.dtype("<f4"), 1: np.dtype("<f2")}
+DTYPE_CODES = {"float32": 0, "float16": 1}
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _layout(count, dim, ids_size, dtype):
+    mask_offset = _align(HEADER.size + ids_size)
+    food_offset = _align(mask_offset + count * 2)
+    place_offset = _align(food_offset + count * dim * dtype.itemsize)
+    end = place_offset + count * dim * dtype.itemsize
+    return mask_offset, food_offset, place_offset, end
+
+
+class VectorStoreWriter:
+    """
+    Pre-allocates a store for a known list of ids and fills it row by row,
+    so vectors never have to be held in memory all at once.
+    """
+
+    def __init__(self, path, ids, dim = 4096, dtype = "float32"):
+        self.path = path
+        self.ids = list(ids)
+        self.dim = dim
+        self.dtype = DTYPES[DTYPE_CODES[dtype]]
+        self.positions = {place_id: i for i, place_id in enumerate(self.ids)}
+
+        ids_blob = "\n".join(self.ids).encode("utf-8")
+        count = len(self.ids)
+        mask_offset, food_offset, place_offset, end = _layout(count, dim, len(ids_blob), self.dtype)
+
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, DTYPE_CODES[dtype], count, dim, len(ids_blob)))
+            f.write(ids_blob)
+            f.truncate(end)
+
+        self._map = np.memmap(path, dtype=np.uint8, mode="r+")
+        self.mask = self._map[mask_offset:mask_offset + count * 2].reshape(count, 2)
+        self.food = self._map[food_offset:food_offset + count * dim * self.dtype.itemsize].view(self.dtype).reshape(count, dim)
+        self.place = self._map[place_offset:end].view(self.dtype).reshape(count, dim)
+
+    def write(self, place_id, food_vector, place_vector):
+        i = self.positions[place_id]
+        if food_vector is not None:
+            self.food[i] = food_vector
+            self.mask[i, 0] = 1
+        if place_vector is not None:
+            self.place[i] = place_vector
+            self.mask[i, 1] = 1
+
+    def close(self):
+        self._map.flush()
+        del self.mask, self.food, self.place, self._map
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class VectorStore:
+    """
+    Read-only, memory-mapped view of a vector store file.
+    `food` and `place` are zero-copy numpy views into the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._map = np.memmap(path, dtype=np.uint8, mode="r")
+
+        magic, version, dtype_code, count, dim, ids_size = HEADER.unpack(self._map[:HEADER.size].tobytes())
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a vector store file")
+
+        self.dtype = DTYPES[dtype_code]
+        self.dim = dim
+        ids_blob = self._map[HEADER.size:HEADER.size + ids_size].tobytes().decode("utf-8")
+        self.ids = ids_blob.split("\n") if count else []
+        self.positions = {place_id: i for i, place_id in enumerate(self.ids)}
+
+        mask_offset, food_offset, place_offset, end = _layout(count, dim, ids_size, self.dtype)
+        self.mask = self._map[mask_offset:mask_offset + count * 2].reshape(count, 2)
+        self.food = self._map[food_offset:food_offset + count * dim * self.dtype.itemsize].view(self.dtype).reshape(count, dim)
+        self.place = self._map[place_offset:end].view(self.dtype).reshape(count, dim)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, place_id):
+        return place_id in self.positions
+
+    def get(self, place_id):
+        """
+        Return (food_vector, place_vector) for a place, None for missing vectors.
+        """
+        i = self.positions[place_id]
+        food = self.food[i] if self.mask[i, 0] else None
+        place = self.place[i] if self.mask[i, 1] else None
+        return food, place
+
+    def __iter__(self):
+        for place_id in self.ids:
+            food, place = self.get(place_id)
+            yield place_id, food, place
+
+
+def open_vector_store(path):
+    return VectorStore(path)
+
+
+def store_path(path):
+    """
+    Path of the binary vector store belonging to a `proc_data_<city>` file.
+    """
+    return path + "_vec.bin"
+
+
+def text_path(path):
+    """
+    Path of the caption texts belonging to a `proc_data_<city>` file.
+    """
+    return path + "_text"
+
+
+def read_city_vectors(path, dim = 4096):
+    """
+    Return (ids, food, place) float32 matrices for a `proc_data_<city>` file,
+    from its binary store if present, otherwise from the legacy JSON `_vec` file.
+    Missing vectors are zero rows.
+    """
+    if os.path.exists(store_path(path)):
+        store = open_vector_store(store_path(path))
+        return list(store.ids), np.asarray(store.food, dtype=np.float32), np.asarray(store.place, dtype=np.float32)
+
+    with open(path + "_vec", "r") as f:
+        data_vec = json.load(f)
+    ids = list(data_vec.keys())
+    food = np.zeros((len(ids), dim), dtype=np.float32)
+    place = np.zeros((len(ids), dim), dtype=np.float32)
+    for i, place_id in enumerate(ids):
+        if data_vec[place_id]["foodVector"] is not None:
+            food[i] = data_vec[place_id]["foodVector"]
+        if data_vec[place_id]["restaurantVector"] is not None:
+            place[i] = data_vec[place_id]["restaurantVector"]
+    return ids, food, place
+
+
+def convert_json_vec(path, dtype = "float32", dim = 4096):
+    """
+    Convert a legacy `proc_data_<city>_vec` JSON file into the binary store
+    plus a small JSON file holding the caption texts.
+    """
+    with open(path + "_vec", "r") as f:
+        data_vec = json.load(f)
+
+    with VectorStoreWriter(store_path(path), data_vec.keys(), dim, dtype) as writer:
+        for place_id, entry in data_vec.items():
+            writer.write(place_id, entry["foodVector"], entry["restaurantVector"])
+
+    texts = {place_id: {"foodText": entry["foodText"], "restaurantText": entry["restaurantText"]}
+             for place_id, entry in data_vec.items()}
+    with open(text_path(path), "w") as f:
+        f.write(json.dumps(texts))
+
+
+if __name__ == "__main__":
+    # Usage: python vector_store.py <proc_data_file> [float32|float16]
+    dtype = sys.argv[2] if len(sys.argv) > 2 else "float32"
+    convert_json_vec(sys.argv[1], dtype)
+    print(f"Wrote {store_path(sys.argv[1])} ({os.path.getsize(store_path(sys.argv[1]))} bytes)")
@@ -1,14 +1,31 @@
 import os
 import json
-from time import sleep
+import argparse
+import threading
+import numpy as np
 from PIL import Image
 from dotenv import load_dotenv
+import vector_store as vstore
+from embedding_cache import EmbeddingCache
+from image_cache import ImageCache
+from embedding_batcher import EmbeddingBatcher
+from pipeline import TokenBucket, Stage, call_with_backoff, run_pipeline
+from journal import PlaceJournal
+import record_stream as rs
 
 # Load environment variables from .env file
 load_dotenv()
 
 mistral_client = None
 gemini_client = None
+embedding_cache = None
+image_cache = None
+
+EMBEDDING_MODEL = "Linq-AI-Research/Linq-Embed-Mistral"
+
+# Per-provider request rate limits, in requests per minute
+gemini_limiter = TokenBucket(float(os.getenv("GEMINI_RPM", "15")) / 60)
+embedding_limiter = TokenBucket(float(os.getenv("EMBEDDING_RPM", "60")) / 60)
 
 test_url = "https://www.pingodoce.pt/wp-content/uploads/2017/09/francesinha.jpg"
 text_restauraunt_url = "https://lh3.googleusercontent.com/places/ANXAkqEIETZdepNjyZOvea4HrXuaiH4YyZlV3nEDksvNIfuzAK8uN3PIeRnrSyPDPfu6Cw1xvXov6OHB_WlbIn7I9vTleXvgo6ZdFhU=s4800-h3164"
@@ -27,15 +44,51 @@ def starting_mistral_client():
         base_url=api_base
     )
 
+def get_embedding_cache():
+    global embedding_cache
+    if embedding_cache is None:
+        embedding_cache = EmbeddingCache(
+            os.getenv("EMBEDDING_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".embedding_cache")),
+            int(os.getenv("EMBEDDING_CACHE_MAX_MB", "256")) * 1024 * 1024
+        )
+    return embedding_cache
+
 def creating_embeddings_from_text(input):
 
+    # Reuse embeddings of text we have already sent
+    cache = get_embedding_cache()
+    cached = cache.get(EMBEDDING_MODEL, input)
+    if cached is not None:
+        return cached
+
     # Generating embeddings from input
-    response = mistral_client.embeddings.create(
+    response = call_with_backoff(lambda: mistral_client.embeddings.create(
         input=input,
-        model="Linq-AI-Research/Linq-Embed-Mistral"
-    )
+        model=EMBEDDING_MODEL
+    ), embedding_limiter)
 
-    return response.data[0].embedding
+    embedding = response.data[0].embedding
+    cache.put(EMBEDDING_MODEL, input, embedding)
+    return embedding
+
+def creating_embeddings_from_texts(inputs):
+
+    # Only texts that are not cached go to the endpoint, in one request
+    cache = get_embedding_cache()
+    embeddings = [cache.get(EMBEDDING_MODEL, text) for text in inputs]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+    if missing:
+        response = call_with_backoff(lambda: mistral_client.embeddings.create(
+            input=[inputs[i] for i in missing],
+            model=EMBEDDING_MODEL
+        ), embedding_limiter)
+        for item in response.data:
+            i = missing[item.index]
+            embeddings[i] = item.embedding
+            cache.put(EMBEDDING_MODEL, inputs[i], item.embedding)
+
+    return embeddings
 
 def starting_gemini_client():
     from google import genai
@@ -43,30 +96,37 @@ def starting_gemini_client():
     api_key = os.getenv("GEMINI_API_KEY")
     gemini_client = genai.Client(api_key=api_key)
 
+def get_image_cache():
+    global image_cache
+    if image_cache is None:
+        image_cache = ImageCache(
+            os.getenv("IMAGE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".image_cache")),
+            int(os.getenv("IMAGE_MAX_SIDE", "1024")),
+            int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+        )
+    return image_cache
+
 def url_to_image(url):
     from io import BytesIO
-    import requests
 
-    image_from_url = requests.get(url)
-    image = Image.open(BytesIO(image_from_url.content))
+    image = Image.open(BytesIO(get_image_cache().fetch(url)))
     return image
 
+def url_to_image_part(url):
+    from google.genai import types
+
+    # Upload the cached, downscaled JPEG as-is instead of re-encoding a PIL image
+    return types.Part.from_bytes(data=get_image_cache().fetch(url), mime_type="image/jpeg")
+
 def path_to_image(path):
     image = Image.open(path)
     return image
 
 def gemini_generate_text(prompt):
-    response = None
-    while response == None:
-        try: 
-            response = gemini_client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=prompt
-            )
-        except:
-            print(f"sleeping {prompt}")
-            sleep(61)
-    return response
+    return call_with_backoff(lambda: gemini_client.models.generate_content(
+        model="gemini-2.0-flash",
+        contents=prompt
+    ), gemini_limiter)
 
 def text_from_user_food_preferences(preferences):
     prompt = f"""
@@ -94,18 +154,10 @@ def text_from_user_restaurant_preferences(preferences):
     return response.text
 
 def gemini_generate_text_from_image(image,prompt):
-    response = None
-
-    while response == None:
-        try: 
-            response = gemini_client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=[image, prompt]
-            )
-        except:
-            print(f"sleeping {prompt}")
-            sleep(61)
-    return response
+    return call_with_backoff(lambda: gemini_client.models.generate_content(
+        model="gemini-2.0-flash",
+        contents=[image, prompt]
+    ), gemini_limiter)
 
 def detect_image_type(image):
     prompt ="""
@@ -141,13 +193,57 @@ Comment on its colourfulness, texture, and overall vibe, as if you're painting a
 
     return response.text
 
-def create_image_text(path, url = 0):
+def create_image_text(path, url = 0, combined = 1):
     if url == 1:
-        image = url_to_image(path)
+        image = url_to_image_part(path)
     else :
         image = path_to_image(path)
+    return caption_image(image, combined)
+
+def classify_and_caption_image(image):
+    prompt ="""
+You will be shown a photo that is either of a restaurant or of food. In a single answer, classify it and describe it.
+
+- If it is a photo of a restaurant, use type 0 and write a concise description (between 50 and 100 words) that captures
+the restaurant’s style, colour palette, overall mood, and atmosphere or vibe, focusing on architectural and decorative details,
+lighting, furniture, and any other cues that help convey its character.
+- If it is a photo of food, use type 1 and write a vivid, sensory-rich description (50–100 words) of the food’s style, mood and
+personality, colourfulness, texture, and overall vibe, as if painting a picture with words for someone who’s never seen or tasted it.
+
+IMPORTANT: Your response must ONLY contain a JSON object of the form {"type": 0, "caption": "..."}.
+Do not include any explanation, markdown, or other text in your response.
+    """
+    response = gemini_generate_text_from_image(image,prompt)
+
+    return parse_image_caption(response.text)
+
+def parse_image_caption(text):
+    """
+    Strictly parse the answer of `classify_and_caption_image` into (type, caption).
+    Raises ValueError if the answer is not exactly the expected JSON object.
+    """
+    text = text.strip()
+    # Tolerate a markdown code fence around the object, nothing else
+    if text.startswith("```"):
+        text = text.removeprefix("```json").removeprefix("```").removesuffix("```").strip()
+    answer = json.loads(text)
+    if not isinstance(answer, dict) or set(answer) != {"type", "caption"}:
+        raise ValueError(f"Unexpected caption answer: {text}")
+    if type(answer["type"]) is not int or answer["type"] not in (0, 1):
+        raise ValueError(f"Unexpected image type: {answer['type']}")
+    if not isinstance(answer["caption"], str) or not answer["caption"].strip():
+        raise ValueError("Empty caption")
+    return answer["type"], answer["caption"].strip()
+
+def caption_image(image, combined = 1):
+    if combined == 1:
+        try:
+            return classify_and_caption_image(image)
+        except ValueError as e:
+            # json.JSONDecodeError is a ValueError too, fall back to the two-call path
+            print(f"combined caption failed, falling back: {e}")
+
     food_type = int(detect_image_type(image))
-    print(food_type)
     ret = (None,None)
     if food_type == 0:
         ret = (0,text_from_restaurant_image(image))
@@ -156,46 +252,151 @@ def create_image_text(path, url = 0):
         
     return ret
 
-def create_embeddings_file(path):
+def iter_previous_results(path):
+    """
+    Stream (place_id, entry) results of an earlier run, from the binary store
+    and texts file if present, otherwise from the legacy JSON `_vec` file.
+    Store vectors are zero-copy views, valid while the old file is in place.
+    """
+    if os.path.exists(vstore.store_path(path)):
+        store = vstore.open_vector_store(vstore.store_path(path))
+        texts = {}
+        if os.path.exists(vstore.text_path(path)):
+            with open(vstore.text_path(path),"r") as f:
+                texts = json.load(f)
+        for ind_p, food_v, restaurant_v in store:
+            entry = texts.get(ind_p, {"foodText":"", "restaurantText":""})
+            yield ind_p, {"foodText":entry["foodText"], "restaurantText":entry["restaurantText"],
+                          "foodVector":food_v, "restaurantVector":restaurant_v}
+    elif os.path.exists(path + "_vec"):
+        yield from rs.iter_records(path + "_vec")
+
+def create_embeddings_file(path, batch_size = 32, flush_interval = 5.0, workers = 4, combined = 1, only_missing = 0):
     starting_gemini_client()
     starting_mistral_client()
 
-    f = open(path,"r")
-    data = json.load(f)
-
-    ret_dic = {}
-
-    for ind_p in data:
-        if data[ind_p]["primaryType"] in ["shopping_mall","hotel","cultural_center"]:
-            pass
-
-        place = data[ind_p]
+    # Only the first photos of each place are kept in memory
+    data = {ind_p: {"photos": place["photos"][:4]} for ind_p, place in rs.iter_records(path)}
+
+    # The new store is written next to the old one, which is streamed from
+    # and only replaced once the run completes
+    texts = {ind_p: {"foodText":"", "restaurantText":""} for ind_p in data}
+    store_tmp = vstore.store_path(path) + ".tmp"
+    writer = vstore.VectorStoreWriter(store_tmp, data.keys())
+    done = set()
+
+    def restore(ind_p, entry):
+        writer.write(ind_p, entry["foodVector"], entry["restaurantVector"])
+        texts[ind_p] = {"foodText":entry["foodText"], "restaurantText":entry["restaurantText"]}
+
+    # Earlier results go straight into the store, only their ids and texts stay in memory
+    if only_missing == 1:
+        # Keep earlier results that have both vectors, redo the rest
+        for ind_p, entry in iter_previous_results(path):
+            if ind_p in data:
+                restore(ind_p, entry)
+                if entry["foodVector"] is not None and entry["restaurantVector"] is not None:
+                    done.add(ind_p)
+
+    # Places finished by an interrupted run are journaled and skipped
+    journal = PlaceJournal(path + "_vec.journal")
+    for ind_p, entry in journal.iter_entries():
+        if ind_p in data:
+            restore(ind_p, entry)
+            done.add(ind_p)
+
+    todo = [ind_p for ind_p in data if ind_p not in done]
+    print(f"{len(data) - len(todo)} places already done, {len(todo)} to process")
+
+    # Embeddings of a place are only held until the place is journaled
+    pending = {}
+    vectors = {}
+    pending_lock = threading.Lock()
+
+    def finish_place(ind_p):
+        with pending_lock:
+            pending.pop(ind_p, None)
+            food_v = vectors.pop((ind_p, "food"), None)
+            restaurant_v = vectors.pop((ind_p, "restaurant"), None)
+        journal.append(ind_p, texts[ind_p]["foodText"], texts[ind_p]["restaurantText"], food_v, restaurant_v)
+
+    def write_embedding(key, embedding):
+        ind_p, vector_type = key
+        if vector_type == "food":
+            writer.write(ind_p, embedding, None)
+        else:
+            writer.write(ind_p, None, embedding)
+
+        with pending_lock:
+            vectors[key] = embedding
+            pending[ind_p] -= 1
+            finished = pending[ind_p] == 0
+        if finished:
+            finish_place(ind_p)
+
+    batcher = EmbeddingBatcher(creating_embeddings_from_texts, batch_size, flush_interval, write_embedding)
+
+    def fetch(ind_p):
+        photos = data[ind_p]["photos"][:4]
+        return ind_p, [url_to_image_part(url) for url in photos]
+
+    def caption(item):
+        ind_p, images = item
         food_t = ""
-        food_v = None
         restaurant_t = ""
-        restaurant_v = None
 
-        for image_ind in range(min(len(place["photos"]),4)):
-            if(food_v and restaurant_v):
-                pass
+        for image in images:
+            if(food_t and restaurant_t):
+                break
 
-            image_url = place["photos"][image_ind]
-            image_type, text = create_image_text(image_url,1)
+            image_type, text = caption_image(image, combined)
 
-            if image_type == 1 and food_v == None:
+            if image_type == 1 and not food_t:
                 food_t = text
-                food_v = creating_embeddings_from_text(text)
-            elif image_type == 0 and restaurant_v == None:
+            elif image_type == 0 and not restaurant_t:
                 restaurant_t = text
-                restaurant_v = creating_embeddings_from_text(text)
 
-        ret_dic[ind_p] = {"foodVector": food_v, "restaurantVector": restaurant_v, "foodText":food_t, "restaurantText":restaurant_t}
-
-    f.close()
-    f = open(path + "_vec","w")
-    f.write(json.dumps(ret_dic))
+        return ind_p, food_t, restaurant_t
+
+    def embed(item):
+        # Embeddings are requested in batches across places
+        ind_p, food_t, restaurant_t = item
+        # Keep earlier texts when only a missing vector is being filled in
+        texts[ind_p] = {"foodText":food_t or texts[ind_p]["foodText"],
+                        "restaurantText":restaurant_t or texts[ind_p]["restaurantText"]}
+        with pending_lock:
+            pending[ind_p] = int(bool(food_t)) + int(bool(restaurant_t))
+            nothing_to_embed = pending[ind_p] == 0
+        if nothing_to_embed:
+            finish_place(ind_p)
+        if food_t:
+            batcher.submit((ind_p, "food"), food_t)
+        if restaurant_t:
+            batcher.submit((ind_p, "restaurant"), restaurant_t)
+
+    # fetch -> classify/caption -> embed, the vector store is written as batches return
+    stats = run_pipeline(todo, [
+        Stage("fetch", fetch, workers),
+        Stage("caption", caption, workers),
+        Stage("embed", embed, 1),
+    ])
+    batcher.flush()
+    writer.close()
+    os.replace(store_tmp, vstore.store_path(path))
+
+    for stage in stats:
+        print(stage)
+    print(f"embed requests: {batcher.requests}")
+    print(f"image cache: {get_image_cache().stats()}")
+
+    f = open(vstore.text_path(path),"w")
+    f.write(json.dumps(texts))
     f.close()
 
+    # Every place reached the store, the journal is no longer needed
+    if not any(stage.errors for stage in stats):
+        journal.remove()
+
 def create_embeddings_from_preferences(preferences, food = 0):
     starting_gemini_client()
     starting_mistral_client()
@@ -206,17 +407,52 @@ def create_embeddings_from_preferences(preferences, food = 0):
     restaurant_vector = creating_embeddings_from_text(response)
     return restaurant_vector
 
-def average_embedding(embeddings):
+def average_embedding(embeddings, weights = None):
     """
-    Calculate the average of a list of embeddings.
+    Calculate the (optionally weighted) average of a list of embeddings.
     """
-    if not embeddings:
+    if embeddings is None or len(embeddings) == 0:
         return None
-    average_embedding = []
-    len_embeddings = len(embeddings[0])
-    if len_embeddings == 1 :
-        return embeddings
-    for x in range(len_embeddings):
-        average_embedding.append(sum([embedding[x] for embedding in embeddings]) / len(embeddings))
-
-    return average_embedding
\ No newline at end of file
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim == 1:
+        return matrix
+    return np.average(matrix, axis=0, weights=weights).astype(np.float32)
+
+def update_mean(mean, count, embedding, decay = 0.0):
+    """
+    Fold one more embedding into a stored mean of `count` embeddings in O(d).
+    With `decay` > 0 the update weight never drops below `decay`, so the mean
+    becomes an exponential moving average that favours recent embeddings.
+    """
+    embedding = np.asarray(embedding, dtype=np.float32)
+    if mean is None or count == 0:
+        return embedding
+    mean = np.asarray(mean, dtype=np.float32)
+    weight = max(1.0 / (count + 1), decay)
+    return mean + weight * (embedding - mean)
+
+def vector_to_list(vector):
+    """
+    Convert a numpy or list vector into a plain list of floats for JSON encoding.
+    """
+    if hasattr(vector, "tolist"):
+        return vector.tolist()
+    return list(vector)
+
+def vector_to_json(vector):
+    """
+    Compact JSON array of a vector for VECTOR columns: every component is
+    written with 9 significant digits, enough to round-trip float32 exactly.
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    return "[" + ",".join(np.char.mod("%.9g", vector)) + "]"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Caption and embed the photos of a proc_data_<city> file")
+    parser.add_argument("path")
+    parser.add_argument("--only-missing", action="store_true", help="only redo places missing a food or place vector")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    create_embeddings_file(args.path, batch_size=args.batch_size, workers=args.workers, only_missing=int(args.only_missing))
\ No newline at end of file
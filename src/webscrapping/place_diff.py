@@ -0,0 +1,101 @@
+"""
+Change detection between two scrapes of a city.
+
+Places are compared by id and by a fingerprint of the fields that matter
+downstream, so captioning, embedding and population only need to run on
+the places that were added or changed.
+
+The fresh scrape is kept as a pending snapshot next to the baseline and
+only becomes the new baseline once its delta has been loaded, so a scrape
+re-run before that diffs against the same baseline and nothing is lost.
+"""
+import os
+import sys
+import json
+import hashlib
+
+sys.path.insert(0,"../vectorization")
+import record_stream as rs
+
+FINGERPRINT_FIELDS = ("rating", "photos", "openingHours", "summary")
+
+
+def fingerprint(place):
+    content = {field: place.get(field) for field in FINGERPRINT_FIELDS}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def diff_places(previous_path, fresh):
+    """
+    Compare a fresh scrape (dict of place_id -> record) with the previous
+    `proc_data_<city>` file, which is streamed so only fingerprints are kept.
+    Returns (added, changed, removed): two dicts of records and a list of ids.
+    Without a previous file (first run) every place is added.
+    """
+    previous = {}
+    if os.path.exists(previous_path) or os.path.exists(rs.ndjson_path(previous_path)):
+        previous = {place_id: fingerprint(place) for place_id, place in rs.iter_records(previous_path)}
+
+    added = {}
+    changed = {}
+    for place_id, place in fresh.items():
+        if place_id not in previous:
+            added[place_id] = place
+        elif previous[place_id] != fingerprint(place):
+            changed[place_id] = place
+
+    removed = [place_id for place_id in previous if place_id not in fresh]
+    return added, changed, removed
+
+
+def delta_path(path):
+    """
+    The delta is a regular `proc_data` file, so the embedding and population
+    steps can run on it unchanged; removed ids go to `<delta>_removed`.
+    """
+    return path + "_delta"
+
+
+def write_delta(path, added, changed, removed):
+    with open(delta_path(path), "w") as f:
+        f.write(json.dumps({**added, **changed}))
+    with open(delta_path(path) + "_removed", "w") as f:
+        f.write(json.dumps(removed))
+
+
+def pending_path(path):
+    return path + "_next"
+
+
+def write_pending(path, fresh):
+    """
+    Keep the fresh scrape until its delta is loaded, see `commit_snapshot`.
+    """
+    with open(pending_path(path) + ".tmp", "w") as f:
+        f.write(json.dumps(fresh))
+    os.replace(pending_path(path) + ".tmp", pending_path(path))
+
+
+def baseline_of_delta(path):
+    """The baseline a delta file was diffed against, or None if `path` is not a delta"""
+    suffix = delta_path("")
+    return path[:-len(suffix)] if path.endswith(suffix) else None
+
+
+def commit_snapshot(path):
+    """
+    Atomically make the pending scrape the new baseline, keeping its `.ndjson`
+    copy in sync. Called by `populate.py` once the delta has been loaded.
+    Returns False when there is no pending scrape.
+
+    The `_vec.bin` vector store of `path` is left as is: it only covers the
+    places embedded so far, so new and changed places must be embedded and
+    loaded through the delta. A full `populate.py` load of the snapshot skips
+    the places the store has no vectors for.
+    """
+    if not os.path.exists(pending_path(path)):
+        return False
+    os.replace(pending_path(path), path)
+    if os.path.exists(rs.ndjson_path(path)):
+        rs.convert_to_ndjson(path)
+    return True
@@ -1,88 +1,292 @@
 import json
 import os 
+import hashlib
 import dotenv
 import sys
+import time
+import argparse
+import numpy as np
 import mysql.connector
+from mysql.connector import errorcode
 
 sys.path.insert(0,"../vectorization")
 import vectorization as vect
+import vector_store as vstore
+import record_stream as rs
+import ann_index as ann
+import place_diff
+
+sys.path.insert(0,"../../backend")
+import catalogue as cat
 
 dotenv.load_dotenv()
 
 
-def load_file_db(path):
+PLACE_QUERY = '''
+    INSERT INTO restaurant (restaurant_id,name,rating,url_location,food_vector,place_vector,price_range_max,price_range_min,price_level,
+type,reservable,vegetarian,summary,content_hash)
+    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+'''
+
+UPSERT_QUERY = PLACE_QUERY + '''
+    ON DUPLICATE KEY UPDATE name=VALUES(name),rating=VALUES(rating),url_location=VALUES(url_location),
+food_vector=VALUES(food_vector),place_vector=VALUES(place_vector),price_range_max=VALUES(price_range_max),
+price_range_min=VALUES(price_range_min),price_level=VALUES(price_level),type=VALUES(type),reservable=VALUES(reservable),
+vegetarian=VALUES(vegetarian),summary=VALUES(summary),content_hash=VALUES(content_hash)
+'''
+
+PHOTO_QUERY = '''
+    INSERT INTO photo (url,restaurant_id)
+    VALUES (%s,%s)
+'''
+
+# A photo URL may move to another restaurant between scrapes
+PHOTO_UPSERT_QUERY = PHOTO_QUERY + '''
+    ON DUPLICATE KEY UPDATE restaurant_id=VALUES(restaurant_id)
+'''
 
-    conn = mysql.connector.connect(
+# Restaurants written per transaction; each row carries two 4096-d vectors (~110 KB)
+CHUNK_SIZE = int(os.getenv("POPULATE_CHUNK_SIZE", 50))
+
+
+def get_connection():
+    return mysql.connector.connect(
         host=os.getenv("DB_HOST"),
         user=os.getenv("DB_USERNAME"),
         password=os.getenv("DB_PASSWORD"),
         database=os.getenv("DB_DATABASE"),
         port=int(os.getenv("DB_PORT")))
 
-    file = open(path,"r")
-    file_vec = open(path + "_vec","r")
-    data = json.load(file)
-    data_vec = json.load(file_vec)
-
-    for key in data:
-        place = data[key]
-
-        if place["primaryType"] in ["shopping_mall","hotel","cultural_center"]:
-            pass
-
-        place_query = '''
-            INSERT INTO restaurant (restaurant_id,name,rating,url_location,food_vector,place_vector,price_range_max,price_range_min,price_level,
-type,reservable,vegetarian,summary)  
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)     
-        '''
-        
-        if data_vec[key]["restaurantVector"] == None:
-            data_vec[key]["restaurantVector"] = [0]*4096
-
-        if data_vec[key]["foodVector"] == None:
-            data_vec[key]["foodVector"] = [0]*4096
-
-        cursor = conn.cursor()
-        cursor.execute(place_query,(
-                       key,
-                       place["displayName"],
-                       place["rating"],
-                       place["mapsURI"],
-                       json.dumps(data_vec[key]["foodVector"]),
-                       json.dumps(data_vec[key]["restaurantVector"]),
-                       place["priceRange"]["end"],
-                       place["priceRange"]["start"],
-                       place["priceLevel"],
-                       place["primaryType"],
-                       place["reservable"],
-                       place["vegetarian"],
-                       place["summary"])
-                       )
-        conn.commit() 
-        cursor.close()
 
+def content_hash(place, food_vector, restaurant_vector):
+    """
+    sha256 of the record and both vectors, stored per restaurant so an
+    upsert can tell which rows actually changed.
+    """
+    digest = hashlib.sha256(json.dumps(place, sort_keys=True).encode("utf-8"))
+    digest.update(np.asarray(food_vector, dtype="<f4").tobytes())
+    digest.update(np.asarray(restaurant_vector, dtype="<f4").tobytes())
+    return digest.hexdigest()
+
+
+def ensure_content_hash_column(cursor):
+    # Tables created before the column existed get it added on first use
+    try:
+        cursor.execute("ALTER TABLE restaurant ADD COLUMN content_hash CHAR(64)")
+    except mysql.connector.Error as e:
+        if e.errno != errorcode.ER_DUP_FIELDNAME:
+            raise
+
+
+def stored_hashes(cursor):
+    cursor.execute("SELECT restaurant_id, content_hash FROM restaurant")
+    return dict(cursor.fetchall())
+
+
+def removed_path(path):
+    """
+    Ids dropped since the last scrape, written next to a delta file by `scrapper.py --diff`.
+    """
+    return path + "_removed"
+
+
+def delete_restaurants(cursor, restaurant_ids, chunk_size = CHUNK_SIZE):
+    restaurant_ids = list(restaurant_ids)
+    for i in range(0, len(restaurant_ids), chunk_size):
+        chunk = restaurant_ids[i:i + chunk_size]
+        placeholders = ",".join(["%s"] * len(chunk))
+        cursor.execute(f"DELETE FROM photo WHERE restaurant_id IN ({placeholders})", chunk)
+        cursor.execute(f"DELETE FROM restaurant WHERE restaurant_id IN ({placeholders})", chunk)
+
+
+def place_row(key, place, food_vector, restaurant_vector, row_hash):
+    return (key,
+            place["displayName"],
+            place["rating"],
+            place["mapsURI"],
+            vect.vector_to_json(food_vector),
+            vect.vector_to_json(restaurant_vector),
+            place["priceRange"]["end"],
+            place["priceRange"]["start"],
+            place["priceLevel"],
+            place["primaryType"],
+            place["reservable"],
+            place["vegetarian"],
+            place["summary"],
+            row_hash)
+
+
+def load_file_db(path, chunk_size = CHUNK_SIZE, upsert = False, prune = False):
+    """
+    Bulk load a `proc_data_<city>` file: rows are sent with `executemany`
+    (a single multi-row INSERT) and committed every `chunk_size` restaurants,
+    so a chunk either lands whole or is rolled back.
+
+    With `upsert`, restaurants whose stored content hash matches are skipped,
+    changed ones are updated in place with their photos replaced, and the ids
+    listed in `<path>_removed` are deleted. `prune` (implies `upsert`) also
+    deletes every stored restaurant missing from the file, so it must only
+    be used with a full scrape, never with a delta.
+
+    Places the vector store has no vectors for (e.g. a snapshot updated by
+    `scrapper.py --diff` whose delta was embedded separately) are skipped and
+    their stored rows kept.
+    """
+    upsert = upsert or prune
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    vectors = load_vectors(path)
+
+    # Keep a persisted ANN index in sync with the rows we add
+    ann_path = ann.ann_index_path()
+    ann_index = ann.load_restaurant_ann(ann_path) if ann_path and os.path.exists(ann_path) else None
+
+    rows = []
+    photos = []
+    ann_rows = []
+    n_rows = 0
+    n_photos = 0
+    n_skipped = 0
+    n_missing = 0
+    removed = []
+    seen = set()
+    start = time.perf_counter()
+
+    def flush():
+        if upsert:
+            ids = [row[0] for row in rows]
+            placeholders = ",".join(["%s"] * len(ids))
+            cursor.execute(f"DELETE FROM photo WHERE restaurant_id IN ({placeholders})", ids)
+            cursor.executemany(UPSERT_QUERY, rows)
+            if photos:
+                cursor.executemany(PHOTO_UPSERT_QUERY, photos)
+        else:
+            cursor.executemany(PLACE_QUERY, rows)
+            if photos:
+                cursor.executemany(PHOTO_QUERY, photos)
+        conn.commit()
 
-        photo_query = '''
-            INSERT INTO photo (url,restaurant_id) 
-            VALUES (%s,%s)     
-        '''
+        if ann_index is not None:
+            ann_index.remove([key for key, _, _ in ann_rows if key in stored])
+            for key, food_vector, restaurant_vector in ann_rows:
+                ann_index.add(key, food_vector, restaurant_vector)
 
-        for photo in place["photos"]:
-            cursor = conn.cursor()
-            cursor.execute(photo_query,(photo,key))
+    try:
+        ensure_content_hash_column(cursor)
+        stored = stored_hashes(cursor) if upsert else {}
+
+        # Records are streamed one place at a time
+        for key, place in rs.iter_records(path):
+
+            if place["primaryType"] in ["shopping_mall","hotel","cultural_center"]:
+                pass
+
+            seen.add(key)
+            try:
+                food_vector, restaurant_vector = vectors.get(key)
+            except KeyError:
+                n_missing += 1
+                continue
+
+            if restaurant_vector is None:
+                restaurant_vector = [0]*4096
+
+            if food_vector is None:
+                food_vector = [0]*4096
+
+            row_hash = content_hash(place, food_vector, restaurant_vector)
+            if stored.get(key) == row_hash:
+                n_skipped += 1
+                continue
+
+            rows.append(place_row(key, place, food_vector, restaurant_vector, row_hash))
+            photos.extend((photo, key) for photo in place["photos"])
+            ann_rows.append((key, food_vector, restaurant_vector))
+
+            if len(rows) >= chunk_size:
+                flush()
+                n_rows += len(rows)
+                n_photos += len(photos)
+                rows.clear()
+                photos.clear()
+                ann_rows.clear()
+
+        if rows:
+            flush()
+            n_rows += len(rows)
+            n_photos += len(photos)
+
+        if upsert:
+            if os.path.exists(removed_path(path)):
+                with open(removed_path(path), "r") as f:
+                    removed += [i for i in json.load(f) if i in stored]
+            if prune:
+                listed = set(removed)
+                removed += [i for i in stored if i not in seen and i not in listed]
+            if removed:
+                delete_restaurants(cursor, removed, chunk_size)
+                conn.commit()
+                if ann_index is not None:
+                    ann_index.remove(removed)
+
+        # Running backends reload their restaurant catalogue
+        if n_rows or removed:
+            cat.bump_version(cursor)
             conn.commit()
-            cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
 
-    conn.close()
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {n_rows} restaurants and {n_photos} photos in {elapsed:.1f}s "
+          f"({(n_rows + n_photos) / max(elapsed, 1e-9):.0f} rows/s)")
+    if upsert:
+        print(f"{n_skipped} unchanged, {len(removed)} removed")
+    if n_missing:
+        print(f"{n_missing} places without vectors skipped, load their delta instead")
+
+    if ann_index is not None:
+        ann.save_restaurant_ann(ann_index, ann_path)
+
+    # The delta is in the database: its scrape becomes the baseline of the next diff
+    baseline = place_diff.baseline_of_delta(path)
+    if baseline is not None and place_diff.commit_snapshot(baseline):
+        print(f"{baseline} updated to the loaded scrape")
+
+class JsonVectors:
+    """
+    Legacy `_vec` JSON file exposed with the same `get` interface as a VectorStore.
+    It is streamed alongside the metadata file; records read ahead of the one
+    asked for are buffered, so memory stays flat when both list places in the same order.
+    """
+    def __init__(self, path):
+        self.records = rs.iter_records(path + "_vec")
+        self.buffer = {}
+
+    def get(self, key):
+        while key not in self.buffer:
+            place_id, entry = next(self.records, (None, None))
+            if place_id is None:
+                raise KeyError(key)
+            self.buffer[place_id] = entry
+        entry = self.buffer.pop(key)
+        return entry["foodVector"], entry["restaurantVector"]
+
+def load_vectors(path):
+    """
+    Open the binary vector store of a city, falling back to the legacy JSON file.
+    """
+    if os.path.exists(vstore.store_path(path)):
+        return vstore.open_vector_store(vstore.store_path(path))
+    return JsonVectors(path)
 
 def find_near_preference(user):
     
-    conn = mysql.connector.connect(
-        host=os.getenv("DB_HOST"),
-        user=os.getenv("DB_USERNAME"),
-        password=os.getenv("DB_PASSWORD"),
-        database=os.getenv("DB_DATABASE"),
-        port=int(os.getenv("DB_PORT")))
+    conn = get_connection()
 
     cursor = conn.cursor()
 
@@ -119,5 +323,13 @@ def find_near_preference(user):
 
     print(resp)
 
-    
-        
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a proc_data_<city> file into the restaurant and photo tables")
+    parser.add_argument("path")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="restaurants per transaction")
+    parser.add_argument("--upsert", action="store_true", help="only write restaurants whose content changed")
+    parser.add_argument("--prune", action="store_true", help="with a full scrape, also delete restaurants missing from it")
+    args = parser.parse_args()
+
+    load_file_db(args.path, chunk_size=args.chunk_size, upsert=args.upsert, prune=args.prune)
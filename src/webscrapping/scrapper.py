@@ -5,7 +5,10 @@
 # - It may require specifying regional endpoints when creating the service
 #   client as shown in:
 #   https://googleapis.dev/python/google-api-core/latest/client_options.html
-import os 
+import os
+import math
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 import json
@@ -16,57 +19,141 @@ from google.type import latlng_pb2
 
 load_dotenv()
 
-def sample_get_place(api_key_string):
-    # Create a client
+FIELD_MASK = "places.displayName,places.photos,places.priceRange,places.priceLevel,places.rating,places.googleMapsUri,places.primaryType,places.id,places.reservable,places.userRatingCount,places.servesVegetarianFood,places.editorialSummary,places.currentOpeningHours"
+
+CITY_CENTERS = {
+    "coimbra": (40.2115, -8.4292),
+    "porto": (41.15, -8.61024),
+    "lisboa": (38.7071, -9.13549),
+}
+
+# Meters per degree of latitude
+METERS_PER_DEGREE = 111320
+
+
+def create_client(api_key_string):
     client_op = ClientOptions(api_key= api_key_string)
-    client = places_v1.PlacesClient(client_options=client_op)
+    return places_v1.PlacesClient(client_options=client_op)
 
-    
-    # Initialize request argument(s)
-    center_coimbra = latlng_pb2.LatLng(latitude=40.2115, longitude=-8.4292 )
-    center_porto = latlng_pb2.LatLng(latitude=41.15, longitude=-8.61024 )
-    center_lisboa = latlng_pb2.LatLng(latitude=38.7071, longitude=-9.13549 )
-    circle = places_v1.Circle(center = center_lisboa, radius = 10000)
+
+def tile_circles(latitude, longitude, radius, tile_radius):
+    """
+    Centers of a grid of circles of `tile_radius` meters covering the circle
+    of `radius` meters around (latitude, longitude). Grid spacing is
+    tile_radius * sqrt(2) so neighbouring circles cover each square cell.
+    """
+    step = tile_radius * math.sqrt(2)
+    steps = int(math.ceil(radius / step))
+    meters_per_lon = METERS_PER_DEGREE * math.cos(math.radians(latitude))
+
+    centers = []
+    for i in range(-steps, steps + 1):
+        for j in range(-steps, steps + 1):
+            north, east = i * step, j * step
+            # Skip cells that cannot touch the city circle
+            if math.hypot(north, east) - tile_radius * math.sqrt(2) > radius:
+                continue
+            centers.append((latitude + north / METERS_PER_DEGREE, longitude + east / meters_per_lon))
+    return centers
+
+
+def search_circle(client, latitude, longitude, radius):
+    center = latlng_pb2.LatLng(latitude=latitude, longitude=longitude)
+    circle = places_v1.Circle(center = center, radius = radius)
     restriction = places_v1.SearchNearbyRequest.LocationRestriction()
     restriction.circle = circle
 
-    places_v1.Place()
-
     # Initialize request argument(s)
     request = places_v1.SearchNearbyRequest(location_restriction = restriction,included_types=["restaurant"])
 
     # Make the request
-    resp_dic = {}
-    response = client.search_nearby(request=request, metadata=[("x-goog-fieldmask", "places.displayName,places.photos,places.priceRange,places.priceLevel,places.rating,places.googleMapsUri,places.primaryType,places.id,places.reservable,places.userRatingCount,places.servesVegetarianFood,places.editorialSummary,places.currentOpeningHours")])
-
-    place_list = []
-
-    for place in response.places:
-        photo_list = []
-
-        for p in place.photos:
-            photo_req = places_v1.GetPhotoMediaRequest(name=p.name + "/media",max_height_px = p.height_px)
-            photo_resp = client.get_photo_media(request = photo_req)
-            photo_list.append(photo_resp.photo_uri)
-
-        day_list = []
-        for day in place.current_opening_hours.weekday_descriptions:
-            day_list.append(day)
-
-        resp_dic[place.id] = {"displayName": place.display_name.text,
-                              "priceRange": {"start": place.price_range.start_price.units, "end": place.price_range.end_price.units},
-                              "priceLevel": place.price_level,
-                              "rating": place.rating,
-                              "mapsURI": place.google_maps_uri,
-                              "photos": photo_list,
-                              "primaryType": place.primary_type,
-                              "reservable": place.reservable,
-                              "userRatingCount": place.user_rating_count,
-                              "vegetarian": place.serves_vegetarian_food,
-                              "summary": place.editorial_summary.text,
-                              "openingHours": day_list} 
-
-    # Handle the response
+    response = client.search_nearby(request=request, metadata=[("x-goog-fieldmask", FIELD_MASK)])
+    return list(response.places)
+
+
+def get_photo_uri(client, photo):
+    photo_req = places_v1.GetPhotoMediaRequest(name=photo.name + "/media",max_height_px = photo.height_px)
+    photo_resp = client.get_photo_media(request = photo_req)
+    return photo_resp.photo_uri
+
+
+def place_to_dict(place, photo_list):
+    day_list = []
+    for day in place.current_opening_hours.weekday_descriptions:
+        day_list.append(day)
+
+    return {"displayName": place.display_name.text,
+            "priceRange": {"start": place.price_range.start_price.units, "end": place.price_range.end_price.units},
+            "priceLevel": place.price_level,
+            "rating": place.rating,
+            "mapsURI": place.google_maps_uri,
+            "photos": photo_list,
+            "primaryType": place.primary_type,
+            "reservable": place.reservable,
+            "userRatingCount": place.user_rating_count,
+            "vegetarian": place.serves_vegetarian_food,
+            "summary": place.editorial_summary.text,
+            "openingHours": day_list}
+
+
+def scrape_city(client, latitude, longitude, radius = 10000, tile_radius = 2500, workers = 8):
+    """
+    Search every tile of the city concurrently, deduplicate places by id and
+    resolve all photo URIs in parallel. `tile_radius=None` searches a single circle.
+    """
+    if tile_radius is None:
+        tiles = [(latitude, longitude)]
+        tile_radius = radius
+    else:
+        tiles = tile_circles(latitude, longitude, radius, tile_radius)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda center: search_circle(client, center[0], center[1], tile_radius), tiles)
+
+        places = {}
+        for tile_places in results:
+            for place in tile_places:
+                places.setdefault(place.id, place)
+
+        photo_futures = {place_id: [executor.submit(get_photo_uri, client, p) for p in place.photos]
+                         for place_id, place in places.items()}
+
+        resp_dic = {}
+        for place_id, place in places.items():
+            resp_dic[place_id] = place_to_dict(place, [future.result() for future in photo_futures[place_id]])
+
     return resp_dic
 
-print(json.dumps(sample_get_place(os.getenv("KEY"))))
+
+def sample_get_place(api_key_string, city = "lisboa", tile_radius = None):
+    # Create a client
+    client = create_client(api_key_string)
+    latitude, longitude = CITY_CENTERS[city]
+    return scrape_city(client, latitude, longitude, tile_radius = tile_radius)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch the restaurants of a city from the Places API")
+    parser.add_argument("city", nargs="?", default="lisboa", choices=sorted(CITY_CENTERS))
+    parser.add_argument("--tile-radius", type=float, default=None, help="split the city into circles of this radius (meters)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--diff", metavar="PROC_DATA", help="compare with a previous proc_data_<city> file (if any) and write its delta; "
+                                                      "the file is updated once populate.py has loaded the delta")
+    args = parser.parse_args()
+
+    latitude, longitude = CITY_CENTERS[args.city]
+    resp_dic = scrape_city(create_client(os.getenv("KEY")), latitude, longitude,
+                           tile_radius = args.tile_radius, workers = args.workers)
+
+    if args.diff:
+        import place_diff
+
+        added, changed, removed = place_diff.diff_places(args.diff, resp_dic)
+        place_diff.write_delta(args.diff, added, changed, removed)
+
+        # The fresh scrape becomes the baseline for the next diff once the delta is loaded
+        place_diff.write_pending(args.diff, resp_dic)
+
+        print(f"{len(added)} added, {len(changed)} changed, {len(removed)} removed -> {place_diff.delta_path(args.diff)}")
+    else:
+        print(json.dumps(resp_dic))
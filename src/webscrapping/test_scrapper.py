@@ -0,0 +1,110 @@
+"""
+scrape_city against a local fake PlacesClient: no network, no API key.
+"""
+import math
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("google.maps.places_v1")
+
+import scrapper
+
+LATITUDE, LONGITUDE = scrapper.CITY_CENTERS["coimbra"]
+RADIUS = 3000
+# The Places API returns at most 20 results per request
+MAX_RESULTS = 20
+
+
+def distance(lat_a, lon_a, lat_b, lon_b):
+    north = (lat_a - lat_b) * scrapper.METERS_PER_DEGREE
+    east = (lon_a - lon_b) * scrapper.METERS_PER_DEGREE * math.cos(math.radians(lat_b))
+    return math.hypot(north, east)
+
+
+def fake_place(i, latitude, longitude):
+    text = SimpleNamespace
+    return SimpleNamespace(
+        id=f"place{i}", latitude=latitude, longitude=longitude,
+        photos=[SimpleNamespace(name=f"places/place{i}/photos/{j}", height_px=400) for j in range(2)],
+        display_name=text(text=f"Place {i}"),
+        price_range=SimpleNamespace(start_price=text(units=10), end_price=text(units=20)),
+        price_level=2, rating=4.5, google_maps_uri=f"https://maps.example/place{i}", primary_type="restaurant",
+        reservable=True, user_rating_count=100, serves_vegetarian_food=False,
+        editorial_summary=text(text=""), current_opening_hours=SimpleNamespace(weekday_descriptions=["Monday: 9-17"]))
+
+
+class FakePlacesClient:
+    """Answers search_nearby from a fixed set of places and records photo concurrency"""
+
+    def __init__(self, places):
+        self.places = places
+        self.found = 0
+        self.photo_calls = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def search_nearby(self, request, metadata = None):
+        circle = request.location_restriction.circle
+        found = [place for place in self.places
+                 if distance(place.latitude, place.longitude, circle.center.latitude, circle.center.longitude) <= circle.radius]
+        with self.lock:
+            self.found += len(found[:MAX_RESULTS])
+        return SimpleNamespace(places=found[:MAX_RESULTS])
+
+    def get_photo_media(self, request):
+        with self.lock:
+            self.photo_calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+        return SimpleNamespace(photo_uri=f"https://photos.example/{request.name}")
+
+
+def grid_places(spacing = 400):
+    """Places every `spacing` meters inside the city circle"""
+    places = []
+    steps = int(RADIUS // spacing)
+    meters_per_lon = scrapper.METERS_PER_DEGREE * math.cos(math.radians(LATITUDE))
+    for i in range(-steps, steps + 1):
+        for j in range(-steps, steps + 1):
+            if math.hypot(i * spacing, j * spacing) <= RADIUS:
+                places.append(fake_place(len(places), LATITUDE + i * spacing / scrapper.METERS_PER_DEGREE,
+                                         LONGITUDE + j * spacing / meters_per_lon))
+    return places
+
+
+def test_tiles_cover_the_city():
+    tile_radius = 500
+    centers = scrapper.tile_circles(LATITUDE, LONGITUDE, RADIUS, tile_radius)
+    for place in grid_places(spacing=150):
+        assert any(distance(place.latitude, place.longitude, lat, lon) <= tile_radius for lat, lon in centers)
+
+
+def test_scrape_city_finds_every_place_once():
+    places = grid_places()
+    client = FakePlacesClient(places)
+
+    # A single search is capped, tiling is what finds the rest
+    assert len(scrapper.scrape_city(client, LATITUDE, LONGITUDE, RADIUS, tile_radius=None)) == MAX_RESULTS
+
+    client = FakePlacesClient(places)
+    result = scrapper.scrape_city(client, LATITUDE, LONGITUDE, RADIUS, tile_radius=500, workers=8)
+
+    assert sorted(result) == sorted(place.id for place in places)
+    # Neighbouring tiles overlap, yet each place's photos are resolved once
+    assert client.found > len(places)
+    assert client.photo_calls == 2 * len(places)
+    assert result["place0"]["photos"] == [f"https://photos.example/places/place0/photos/{j}/media" for j in range(2)]
+    assert result["place0"]["displayName"] == "Place 0"
+
+
+def test_photos_are_resolved_in_parallel():
+    client = FakePlacesClient(grid_places(spacing=1000))
+    scrapper.scrape_city(client, LATITUDE, LONGITUDE, RADIUS, tile_radius=None, workers=4)
+    assert client.max_active > 1